@@ -0,0 +1,223 @@
+"""Registered user counts per subject, country, language and age band.
+
+The user_aggregates table is changed by deltas in the same transaction as the profile write, and
+every process keeps an in-memory mirror of it for /stats and search summaries.
+
+    python -m app.bot.aggregates   # recount from the users table, e.g. after manual deletes
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Iterable, Mapping
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.database import async_session_factory
+from app.models import User, UserAggregate
+from app.utils.validation import VALID_COUNTRIES, normalize_location
+
+logger = logging.getLogger(__name__)
+
+SUBJECT = "subject"
+COUNTRY = "country"
+LANGUAGE = "language"
+AGE_BAND = "age_band"
+
+# Поля users, от которых зависят счетчики
+AGGREGATED_FIELDS = ("location_key", "language", "age", "subjects")
+
+# Нижние границы возрастных групп; должны совпадать с CASE в миграции и в rebuild
+AGE_BANDS = ((13, "13–17"), (18, "18–24"), (25, "25–34"), (35, "35–44"), (45, "45–54"), (55, "55+"))
+
+COUNTRY_NAMES = {normalize_location(country): country for country in VALID_COUNTRIES}
+
+Delta = Counter[tuple[str, str]]
+
+
+def age_band(age: int) -> str:
+    band = AGE_BANDS[0][1]
+    for lower, name in AGE_BANDS:
+        if age >= lower:
+            band = name
+    return band
+
+
+def profile_counts(profile: Mapping[str, Any] | None) -> Delta:
+    """The counters one user contributes to; `profile` has the AGGREGATED_FIELDS keys"""
+    counts: Delta = Counter()
+    if profile is None:
+        return counts
+    for subject in set(profile["subjects"]):
+        counts[(SUBJECT, subject)] += 1
+    # У старых профилей location_key может быть не заполнен
+    if profile["location_key"]:
+        counts[(COUNTRY, profile["location_key"])] += 1
+    counts[(LANGUAGE, profile["language"])] += 1
+    counts[(AGE_BAND, age_band(profile["age"]))] += 1
+    return counts
+
+
+def profile_delta(old: Mapping[str, Any] | None, new: Mapping[str, Any] | None) -> Delta:
+    """new - old, keeping negative counts; unchanged counters cancel out"""
+    delta = profile_counts(new)
+    delta.subtract(profile_counts(old))
+    return Counter({key: count for key, count in delta.items() if count})
+
+
+def profile_of(row) -> dict[str, Any]:
+    """AGGREGATED_FIELDS of a User or of a result row that has those columns"""
+    return {name: getattr(row, name) for name in AGGREGATED_FIELDS}
+
+
+def rows_to_profiles(rows: Iterable) -> dict[int, dict[str, Any]]:
+    return {row.telegram_id: profile_of(row) for row in rows}
+
+
+async def lock_profiles(session: AsyncSession, telegram_ids) -> dict[int, dict[str, Any]]:
+    """Current AGGREGATED_FIELDS of the given users, row-locked until the caller's transaction ends.
+
+    Call it before changing the rows: the lock keeps a concurrent change of the same user from
+    computing its delta against the same old values.
+    """
+    query = (
+        select(User.telegram_id, *(getattr(User, name) for name in AGGREGATED_FIELDS))
+        .where(User.telegram_id.in_(telegram_ids))
+        .order_by(User.telegram_id)
+        .with_for_update()
+    )
+    return rows_to_profiles((await session.execute(query)).all())
+
+
+async def apply_delta(session: AsyncSession, delta: Delta) -> None:
+    """Adds the delta inside the caller's transaction.
+
+    Rows are upserted in key order, so concurrent transactions lock shared counters in the same
+    order and cannot deadlock.
+    """
+    rows = [
+        {"dimension": dimension, "value": value, "count": count}
+        for (dimension, value), count in sorted(delta.items()) if count
+    ]
+    if not rows:
+        return
+    query = insert(UserAggregate).values(rows)
+    await session.execute(query.on_conflict_do_update(
+        index_elements=[UserAggregate.dimension, UserAggregate.value],
+        set_={"count": UserAggregate.count + query.excluded.count},
+    ))
+
+
+async def delete_users(session: AsyncSession, condition) -> int:
+    """Deletes the matching users and subtracts them from the counters in the same transaction, then commits"""
+    result = await session.execute(
+        delete(User).where(condition).returning(*(getattr(User, name) for name in AGGREGATED_FIELDS))
+    )
+    delta: Delta = Counter()
+    rows = result.all()
+    for row in rows:
+        delta.update(profile_delta(profile_of(row), None))
+    await apply_delta(session, delta)
+    await session.commit()
+    aggregates.apply(delta)
+    return len(rows)
+
+
+REBUILD_QUERY = text(
+    "INSERT INTO user_aggregates (dimension, value, count) "
+    "SELECT 'subject', subject, count(DISTINCT id) FROM users, unnest(subjects) AS subject GROUP BY subject "
+    "UNION ALL SELECT 'country', location_key, count(*) FROM users WHERE location_key IS NOT NULL "
+    "GROUP BY location_key "
+    "UNION ALL SELECT 'language', language, count(*) FROM users GROUP BY language "
+    "UNION ALL SELECT 'age_band', CASE "
+    "WHEN age >= 55 THEN '55+' WHEN age >= 45 THEN '45–54' WHEN age >= 35 THEN '35–44' "
+    "WHEN age >= 25 THEN '25–34' WHEN age >= 18 THEN '18–24' ELSE '13–17' END, count(*) "
+    "FROM users GROUP BY 2"
+)
+
+
+async def rebuild(session: AsyncSession) -> None:
+    """Recounts everything with full scans; the table is locked so no delta is lost meanwhile"""
+    await session.execute(text("LOCK TABLE user_aggregates IN EXCLUSIVE MODE"))
+    await session.execute(delete(UserAggregate))
+    await session.execute(REBUILD_QUERY)
+    await session.commit()
+
+
+class AggregateMirror:
+    """In-memory copy of user_aggregates.
+
+    The writing process applies its own deltas right after commit; changes made by other
+    processes arrive with the periodic reload every `refresh_interval` seconds.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker,
+                 refresh_interval: float = settings.AGGREGATES_REFRESH_INTERVAL):
+        self.session_pool = session_pool
+        self.refresh_interval = refresh_interval
+        self.counts: Counter[tuple[str, str]] = Counter()
+        self.loaded = False
+        self._task: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        async with self.session_pool() as session:
+            result = await session.execute(
+                select(UserAggregate.dimension, UserAggregate.value, UserAggregate.count)
+            )
+            self.counts = Counter({(dimension, value): count for dimension, value, count in result})
+        self.loaded = True
+
+    def apply(self, delta: Delta) -> None:
+        self.counts.update(delta)
+
+    def count(self, dimension: str, value: str) -> int:
+        return max(self.counts.get((dimension, value), 0), 0)
+
+    def top(self, dimension: str, limit: int | None = None) -> list[tuple[str, int]]:
+        values = [(value, count) for (name, value), count in self.counts.items() if name == dimension and count > 0]
+        values.sort(key=lambda item: (-item[1], item[0]))
+        return values[:limit]
+
+    def total(self) -> int:
+        """Registered users: every user is in exactly one age band"""
+        return sum(count for _, count in self.top(AGE_BAND))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Не удалось загрузить счетчики пользователей")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def country_name(location_key: str) -> str:
+    return COUNTRY_NAMES.get(location_key, location_key)
+
+
+aggregates = AggregateMirror(async_session_factory)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    async def _rebuild() -> None:
+        async with async_session_factory() as session:
+            await rebuild(session)
+
+    asyncio.run(_rebuild())
@@ -1,11 +1,145 @@
-from sqlalchemy import select, and_, update
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
+from typing import Callable, Iterable, Sequence
+
+from sqlalchemy import ARRAY, Integer, Select, select, update, delete, insert, func, cast, case, any_, text, true, and_, or_, union
+from sqlalchemy.dialects.postgresql import BIT, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import User
+from sqlalchemy.orm import aliased, object_session
+from app.bot import seen
+from app.bot.aggregates import (
+    AGGREGATED_FIELDS, aggregates, apply_delta, lock_profiles, profile_delta, profile_of, rows_to_profiles,
+)
+from app.bot.cache import profile_cache
+from app.bot.engine import get_engine, page_ids
+from app.bot.scoring import AGE_DISTANCE_WEIGHT, SAME_LANGUAGE_WEIGHT, SAME_LOCATION_WEIGHT, SHARED_SUBJECT_WEIGHT
+from app.bot.search_cache import search_cache, without
+from app.bot.write_behind import write_behind_queue
+from app.config import settings
+from app.models import User, UserMatch, MatchSubscription, SeenFilter
+from app.utils.metrics import track_operation
+from app.utils.validation import SUBJECT_BITS, normalize_location, normalize_subjects, subjects_to_mask
+
+PAGE_SIZE = 10
+BULK_BATCH_SIZE = 10000
+# Сколько кандидатов за запрос проверяется по фильтру просмотренных, пока не наберется страница
+UNSEEN_SCAN_CHUNK = 500
+# Во сколько раз больше лучших кандидатов берется из движка, если часть из них уже показана
+BEST_UNSEEN_OVERFETCH = 5
+# Первый ключ pg_advisory_xact_lock(int, int) при пересчете списков лучших совпадений, второй - users.id владельца
+MATCHES_LOCK_NAMESPACE = 1
+
+IMPORT_COLUMNS = ("telegram_id", "username", "location", "location_key", "language", "gender", "age", "subjects",
+                  "subjects_mask")
+
+
+# Вызываются с telegram_id после каждого изменения профиля (создание, обновление поля)
+profile_change_listeners: list[Callable[[int], None]] = []
+
+
+def notify_profile_changed(telegram_id: int) -> None:
+    for listener in profile_change_listeners:
+        listener(telegram_id)
+
+
+def candidate_ids_query(condition):
+    """All matching User.id in ascending order, what search_cache keeps per search"""
+    return select(User.id).where(condition).order_by(User.id)
+
+
+def age_condition(target_age: int, range: int):
+    return User.age.between(target_age - range, target_age + range)
+
+
+def location_condition(location_key: str):
+    return User.location_key == location_key
+
+
+def subjects_condition(subjects: list[str], min_shared: int = 1):
+    """Users sharing at least `min_shared` of the given registry subjects.
+
+    The && on the array lets Postgres find candidates through the GIN index ix_users_subjects;
+    the bits of subjects_mask then decide how many subjects are shared.
+    """
+    known = [subject for subject in dict.fromkeys(normalize_subjects(subjects)) if subject in SUBJECT_BITS]
+    shared = User.subjects_mask.op('&')(subjects_to_mask(known))
+    if min_shared <= 1:
+        counted = shared != 0
+    else:
+        counted = func.bit_count(cast(shared, BIT(32))) >= min_shared
+    return and_(User.subjects.op('&&')(known), counted)
+
+
+def search_page_query(telegram_id: int, condition, bits: bytes | None = None) -> Select:
+    """Users matching `condition` except the requester, without those in the seen filter `bits` if given"""
+    query = select(User).where(condition, User.telegram_id != telegram_id)
+    if bits is not None:
+        query = query.where(seen.unseen(User.id, bits))
+    return query
+
+
+def keyset_page_query(query: Select, after_id: int | None, before_id: int | None, limit: int) -> Select:
+    """One keyset page of `query` over User.id, with one extra row to know whether more pages exist"""
+    if before_id is not None:
+        return query.where(User.id < before_id).order_by(User.id.desc()).limit(limit + 1)
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    return query.order_by(User.id).limit(limit + 1)
+
+
+def unseen_chunk_query(chunk: list[int], bits: bytes, limit: int) -> Select:
+    """The first `limit` users of the candidate id `chunk` that are not in the seen filter `bits`"""
+    return (
+        select(User)
+        .where(User.id == any_(cast(chunk, ARRAY(Integer))), seen.unseen(User.id, bits))
+        .order_by(User.id)
+        .limit(limit)
+    )
+
+
+def ids_page_query(ids: Sequence[int]) -> Select:
+    """Rows of one page of candidate ids computed outside the database"""
+    return select(User).where(User.id.in_([int(user_id) for user_id in ids])).order_by(User.id)
+
+
+@dataclass
+class MatchPage:
+    users: list[User]
+    next_cursor: int | None = None
+    prev_cursor: int | None = None
+    # Кандидаты есть, но все уже показаны (фильтр просмотренных)
+    all_seen: bool = False
+
+
+def match_score(candidate, requester):
+    """SQL expression scoring `candidate` for `requester`, both User entities or aliases"""
+    subject = func.unnest(candidate.subjects).table_valued("subject").render_derived()
+    shared_subjects = (
+        select(func.count())
+        .select_from(subject)
+        .where(subject.c.subject == any_(requester.subjects))
+        .correlate_except(subject)
+        .scalar_subquery()
+    )
+    return (
+        shared_subjects * SHARED_SUBJECT_WEIGHT
+        + case((candidate.location_key == requester.location_key, SAME_LOCATION_WEIGHT), else_=0)
+        + case((candidate.language == requester.language, SAME_LANGUAGE_WEIGHT), else_=0)
+        - func.abs(candidate.age - requester.age) * AGE_DISTANCE_WEIGHT
+    )
+
 
 class UserRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, read_session: AsyncSession | None = None):
         self.session = session
+        # Запросы только на чтение могут идти в реплику; записи и пересчеты - всегда в основную БД
+        self.read_session = read_session or session
 
+    @track_operation
     async def create_user(self,
                           telegram_id: int,
                           username: str | None,
@@ -14,62 +148,594 @@ class UserRepository:
                           gender: str,
                           age: int,
                           subjects: list[str]) -> User:
-        normalized_subjects = [subject.strip().lower() for subject in subjects]
+        normalized_subjects = normalize_subjects(subjects)
 
         user = User(
             telegram_id=telegram_id,
             username=username,
             location=location,
+            location_key=normalize_location(location),
             language=language,
             gender=gender,
             age=age,
-            subjects=normalized_subjects
+            subjects=normalized_subjects,
+            subjects_mask=subjects_to_mask(normalized_subjects)
         )
         self.session.add(user)
+        delta = profile_delta(None, profile_of(user))
+        await apply_delta(self.session, delta)
         await self.session.commit()
+        aggregates.apply(delta)
+        search_cache.bump()
+        self._cache_user(user)
+        if engine := get_engine():
+            engine.upsert(user)
+        notify_profile_changed(telegram_id)
         return user
 
+    @track_operation
     async def get_user_by_telegram_id(self, telegram_id: int) -> User | None:
+        user = profile_cache.get(telegram_id)
+        if user is not None:
+            return user
+
         query = select(User).where(User.telegram_id == telegram_id)
-        result = await self.session.execute(query)
-        return result.scalar_one_or_none()
+        result = await self.read_session.execute(query)
+        user = result.scalar_one_or_none()
+        if user is not None:
+            self._cache_user(user)
+            # Read-your-writes: поверх строки из БД накладываем еще не записанные изменения
+            if write_behind_queue is not None:
+                for field, value in write_behind_queue.pending_for(telegram_id).items():
+                    setattr(user, field, value)
+        return user
+
+    @track_operation
+    async def find_matches_by_age_param(self, telegram_id: int, target_age: int, range: int = 3,
+                                        after_id: int | None = None, before_id: int | None = None,
+                                        limit: int = PAGE_SIZE, exclude_seen: bool = False) -> MatchPage:
+        if engine := get_engine():
+            ids = engine.match_age(telegram_id, target_age, range)
+            return await self._fetch_candidates_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+        condition = age_condition(target_age, range)
+        ids = await search_cache.get(("age", target_age, range), lambda limit: self._load_ids(condition, limit))
+        if ids is None:
+            return await self._fetch_query_page(telegram_id, condition, after_id, before_id, limit, exclude_seen)
+        return await self._fetch_shared_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+    @track_operation
+    async def find_matches_by_location_param(self, telegram_id: int, location: str,
+                                             after_id: int | None = None, before_id: int | None = None,
+                                             limit: int = PAGE_SIZE, exclude_seen: bool = False) -> MatchPage:
+        if engine := get_engine():
+            ids = engine.match_location(telegram_id, location)
+            return await self._fetch_candidates_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+        location_key = normalize_location(location)
+        condition = location_condition(location_key)
+        ids = await search_cache.get(("location", location_key), lambda limit: self._load_ids(condition, limit))
+        if ids is None:
+            return await self._fetch_query_page(telegram_id, condition, after_id, before_id, limit, exclude_seen)
+        return await self._fetch_shared_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+    @track_operation
+    async def find_matches_by_subjects_param(self, telegram_id: int, subjects: list[str],
+                                             after_id: int | None = None, before_id: int | None = None,
+                                             limit: int = PAGE_SIZE, min_shared: int = 1,
+                                             exclude_seen: bool = False) -> MatchPage:
+        """Users sharing at least `min_shared` of the given subjects, see subjects_condition"""
+        if engine := get_engine():
+            ids = engine.match_subjects(telegram_id, subjects, min_shared)
+            return await self._fetch_candidates_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+        # Маска не зависит от порядка и повторов предметов, поэтому она же - ключ кэша
+        mask = subjects_to_mask(subjects)
+        if not mask:
+            return MatchPage(users=[])
+        condition = subjects_condition(subjects, min_shared)
+        ids = await search_cache.get(("subjects", mask, min_shared), lambda limit: self._load_ids(condition, limit))
+        if ids is None:
+            return await self._fetch_query_page(telegram_id, condition, after_id, before_id, limit, exclude_seen)
+        return await self._fetch_shared_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+    @track_operation
+    async def find_matches_by_terms(self, subjects: list[str], locations: list[str], after_id: int | None = None,
+                                    limit: int = PAGE_SIZE) -> list[User]:
+        """Users with any of the subjects or living in any of the countries, in id order after `after_id`.
 
-    async def find_matches_by_age_param(self, telegram_id: int, target_age: int, range: int = 3) -> list[User]:
-        query = select(User).where(
-            (User.age.between(target_age - range, target_age + range)) &
-            (User.telegram_id != telegram_id)
+        One query, the requester is not excluded: the inline search shares pages between users and
+        drops the requester when answering.
+        """
+        mask = subjects_to_mask(subjects)
+        location_keys = [normalize_location(location) for location in locations]
+        if engine := get_engine():
+            ids = engine.match_terms(mask, location_keys)
+            return (await self._fetch_page_by_ids(ids, after_id, None, limit)).users
+
+        conditions = []
+        if mask:
+            conditions.append(subjects_condition(subjects))
+        if location_keys:
+            conditions.append(User.location_key.in_(location_keys))
+        if not conditions:
+            return []
+        query = select(User).where(or_(*conditions)).order_by(User.id).limit(limit)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        result = await self.read_session.execute(query)
+        return list(result.scalars().all())
+
+    @track_operation
+    async def find_best_matches(self, telegram_id: int, limit: int = PAGE_SIZE,
+                                exclude_seen: bool = False) -> MatchPage:
+        """Top `limit` candidates ranked against the requester's own profile.
+
+        Only users sharing at least one subject are ranked, so the GIN index bounds the candidate set,
+        and ORDER BY ... LIMIT lets Postgres keep just the top rows.
+        """
+        if engine := get_engine():
+            if not exclude_seen:
+                ids = engine.best_matches(telegram_id, limit)
+                page = await self._fetch_page_by_ids(sorted(ids), None, None, limit)
+            else:
+                ids = engine.best_matches(telegram_id, limit * BEST_UNSEEN_OVERFETCH)
+                page = await self._fetch_unseen_page(telegram_id, sorted(ids), None, len(ids))
+            rank = {int(user_id): position for position, user_id in enumerate(ids)}
+            page.users.sort(key=lambda user: rank[user.id])
+            return MatchPage(users=page.users[:limit])
+
+        requester = aliased(User)
+        score = match_score(User, requester)
+        query = (
+            select(User)
+            .join(requester, requester.telegram_id == telegram_id)
+            .where(
+                User.telegram_id != telegram_id,
+                User.subjects.op('&&')(requester.subjects)
+            )
+            .order_by(score.desc(), User.id)
+            .limit(limit)
         )
-        result = await self.session.execute(query)
-        return result.scalars().all()
+        if exclude_seen and (bits := await self._seen_bits(telegram_id)) is not None:
+            query = query.where(seen.unseen(User.id, bits))
+        result = await self.read_session.execute(query)
+        return MatchPage(users=list(result.scalars().all()))
 
-    async def find_matches_by_location_param(self, telegram_id: int, location: str) -> list[User]:
-        normalized_location = location.strip().lower()
-        query = select(User).where(
-            (User.location.ilike(f"%{normalized_location}%")) &
-            (User.telegram_id != telegram_id)
+    @track_operation
+    async def find_precomputed_matches(self, telegram_id: int, limit: int = PAGE_SIZE,
+                                       exclude_seen: bool = False) -> MatchPage:
+        """Reads the materialized top list from user_matches, one primary key range scan.
+
+        An empty page with all_seen set means the list exists but every candidate was already shown.
+        """
+        owner = aliased(User)
+        query = (
+            select(User)
+            .join(UserMatch, UserMatch.candidate_id == User.id)
+            .join(owner, owner.id == UserMatch.user_id)
+            .where(owner.telegram_id == telegram_id)
+            .order_by(UserMatch.rank)
+            .limit(limit)
         )
-        result = await self.session.execute(query)
-        return result.scalars().all()
+        bits = await self._seen_bits(telegram_id) if exclude_seen else None
+        if bits is not None:
+            query = query.where(seen.unseen(User.id, bits))
+        result = await self.read_session.execute(query)
+        users = list(result.scalars().all())
+        if users or bits is None:
+            return MatchPage(users=users)
 
-    async def find_matches_by_subjects_param(self, telegram_id: int, subjects: list[str]) -> list[User]:
-        normalized_subjects = [subject.strip().lower() for subject in subjects]
-        query = select(User).where(
-            and_(
-                User.telegram_id != telegram_id,
-                User.subjects.op('&&')(normalized_subjects)
+        listed = await self.read_session.scalar(select(
+            select(UserMatch.user_id)
+            .join(owner, owner.id == UserMatch.user_id)
+            .where(owner.telegram_id == telegram_id)
+            .exists()
+        ))
+        return MatchPage(users=[], all_seen=bool(listed))
+
+    @track_operation
+    async def find_affected_owner_ids(self, telegram_ids: list[int], size: int) -> list[int]:
+        """Ids of users whose materialized list may change after the given profiles changed.
+
+        That is the changed users themselves, everyone who currently lists one of them, and everyone
+        for whom a changed user would now enter the top `size` (their list is short or the new
+        score beats their current minimum).
+        """
+        changed = aliased(User)
+        owner = aliased(User)
+        stored = (
+            select(func.count().label("listed"), func.min(UserMatch.score).label("min_score"))
+            .where(UserMatch.user_id == owner.id)
+            .lateral("stored")
+        )
+        entering = (
+            select(owner.id)
+            .join(changed, changed.telegram_id.in_(telegram_ids))
+            .join(stored, true())
+            .where(
+                owner.id != changed.id,
+                owner.subjects.op('&&')(changed.subjects),
+                or_(stored.c.listed < size, match_score(changed, owner) > stored.c.min_score)
             )
         )
+        listing = (
+            select(UserMatch.user_id)
+            .join(User, User.id == UserMatch.candidate_id)
+            .where(User.telegram_id.in_(telegram_ids))
+        )
+        themselves = select(User.id).where(User.telegram_id.in_(telegram_ids))
+
+        result = await self.session.execute(union(themselves, listing, entering))
+        return list(result.scalars().all())
+
+    @track_operation
+    async def refresh_precomputed_matches(self, user_ids: list[int], size: int) -> None:
+        """Recomputes the top `size` lists of the given users in one INSERT ... SELECT.
+
+        Takes a transaction-level advisory lock per owner, so concurrent refreshes of one user are serialized.
+        """
+        owner = aliased(User)
+        candidate = aliased(User)
+        score = match_score(candidate, owner).label("score")
+        top = (
+            select(candidate.id.label("candidate_id"), score)
+            .where(candidate.id != owner.id, candidate.subjects.op('&&')(owner.subjects))
+            .order_by(score.desc(), candidate.id)
+            .limit(size)
+            .lateral("top")
+        )
+        rank = func.row_number().over(partition_by=owner.id, order_by=(top.c.score.desc(), top.c.candidate_id))
+        rows = select(owner.id, rank, top.c.candidate_id, top.c.score).join(top, true()).where(owner.id.in_(user_ids))
+
+        # Параллельные пересчеты одного владельца (пакетный и по изменению профиля) иначе оба проходят DELETE
+        # до INSERT друг друга и падают на первичном ключе (user_id, rank). Блокировки берутся по возрастанию id,
+        # чтобы пересекающиеся пакеты не взаимоблокировались; функция вычисляется после сортировки
+        await self.session.execute(
+            select(func.pg_advisory_xact_lock(MATCHES_LOCK_NAMESPACE, User.id))
+            .where(User.id.in_(user_ids))
+            .order_by(User.id)
+        )
+        await self.session.execute(delete(UserMatch).where(UserMatch.user_id.in_(user_ids)))
+        await self.session.execute(
+            insert(UserMatch).from_select(["user_id", "rank", "candidate_id", "score"], rows)
+        )
+        await self.session.commit()
+
+    @track_operation
+    async def subscribe(self, telegram_id: int) -> None:
+        query = pg_insert(MatchSubscription).from_select(
+            ["user_id"], select(User.id).where(User.telegram_id == telegram_id)
+        ).on_conflict_do_nothing()
+        await self.session.execute(query)
+        await self.session.commit()
+
+    @track_operation
+    async def unsubscribe(self, telegram_id: int) -> None:
+        query = delete(MatchSubscription).where(
+            MatchSubscription.user_id == select(User.id).where(User.telegram_id == telegram_id).scalar_subquery()
+        )
+        await self.session.execute(query)
+        await self.session.commit()
+
+    @track_operation
+    async def claim_subscribers_matching(self, telegram_id: int, cooldown_seconds: int) -> list[int]:
+        """Telegram ids of subscribers the given profile matches, marked as notified in the same statement.
+
+        Subscribers notified less than `cooldown_seconds` ago are skipped, so one set-based UPDATE both
+        selects the audience and rate-limits it per subscriber.
+        """
+        subscriber = aliased(User)
+        changed = aliased(User)
+        query = (
+            update(MatchSubscription)
+            .where(
+                MatchSubscription.user_id == subscriber.id,
+                changed.telegram_id == telegram_id,
+                subscriber.id != changed.id,
+                subscriber.subjects.op('&&')(changed.subjects),
+                or_(
+                    MatchSubscription.last_notified_at.is_(None),
+                    MatchSubscription.last_notified_at < func.now() - timedelta(seconds=cooldown_seconds)
+                )
+            )
+            .values(last_notified_at=func.now())
+            .returning(subscriber.telegram_id)
+            .execution_options(synchronize_session=False)
+        )
         result = await self.session.execute(query)
-        return result.scalars().all()
+        telegram_ids = list(result.scalars().all())
+        await self.session.commit()
+        return telegram_ids
+
+    @track_operation
+    async def mark_seen(self, telegram_id: int, user_ids: list[int]) -> None:
+        """Adds the shown partners to the requester's filter; a full filter starts over"""
+        requester = await self.get_user_by_telegram_id(telegram_id)
+        if requester is None or not user_ids:
+            return
+
+        query = select(SeenFilter.bits, SeenFilter.items).where(SeenFilter.user_id == requester.id).with_for_update()
+        row = (await self.session.execute(query)).one_or_none()
+        if row is None or len(row.bits) != seen.FILTER_BYTES or row.items >= settings.SEEN_FILTER_CAPACITY:
+            bits, items = bytearray(seen.FILTER_BYTES), 0
+        else:
+            bits, items = bytearray(row.bits), row.items
+        items += seen.add(bits, user_ids)
 
+        query = pg_insert(SeenFilter).values(user_id=requester.id, bits=bytes(bits), items=items)
+        await self.session.execute(query.on_conflict_do_update(
+            index_elements=[SeenFilter.user_id],
+            set_={"bits": query.excluded.bits, "items": query.excluded.items, "updated_at": func.now()},
+        ))
+        await self.session.commit()
+
+    async def _seen_bits(self, telegram_id: int) -> bytes | None:
+        """The requester's seen filter, None if nobody was shown yet.
+
+        Read from the primary: mark_seen of the previous page may not have reached a replica yet.
+        """
+        query = (
+            select(SeenFilter.bits)
+            .join(User, User.id == SeenFilter.user_id)
+            .where(User.telegram_id == telegram_id)
+        )
+        return (await self.session.execute(query)).scalar_one_or_none()
+
+    @track_operation
+    async def reset_seen(self, telegram_id: int) -> None:
+        query = delete(SeenFilter).where(
+            SeenFilter.user_id == select(User.id).where(User.telegram_id == telegram_id).scalar_subquery()
+        )
+        await self.session.execute(query)
+        await self.session.commit()
+
+    @track_operation
     async def update_user_field(self, telegram_id: int, field: str, value: any) -> None:
+        values = {field: value}
         if field == "subjects":
-            value = [subject.strip().lower() for subject in value]
+            values[field] = normalize_subjects(value)
+            values["subjects_mask"] = subjects_to_mask(values[field])
+        elif field == "location":
+            values["location_key"] = normalize_location(value)
+
+        if write_behind_queue is not None:
+            self._apply_deferred(telegram_id, values)
+            return
+
+        # Счетчики меняются в той же транзакции, старые значения берутся под блокировкой строки
+        old = None
+        if values.keys() & set(AGGREGATED_FIELDS):
+            old = (await lock_profiles(self.session, [telegram_id])).get(telegram_id)
 
         query = (
             update(User)
             .where(User.telegram_id == telegram_id)
-            .values(**{field: value})
+            .values(**values, version=User.version + 1)
+            .returning(User)
         )
-        await self.session.execute(query)
-        await self.session.commit()
\ No newline at end of file
+        result = await self.session.execute(query)
+        user = result.scalar_one_or_none()
+        delta = profile_delta(old, profile_of(user)) if old is not None and user is not None else None
+        if delta:
+            await apply_delta(self.session, delta)
+        await self.session.commit()
+
+        if user is not None:
+            if delta:
+                aggregates.apply(delta)
+            search_cache.bump(values)
+            self._cache_user(user)
+            if engine := get_engine():
+                engine.upsert(user)
+            notify_profile_changed(telegram_id)
+        else:
+            profile_cache.pop(telegram_id)
+
+    def _apply_deferred(self, telegram_id: int, values: dict) -> None:
+        """Queues the change for the write-behind flush and applies it to every in-memory view right away"""
+        write_behind_queue.enqueue(telegram_id, values)
+        user = profile_cache.get(telegram_id)
+        if user is not None:
+            for field, value in values.items():
+                setattr(user, field, value)
+        if engine := get_engine():
+            engine.update_fields(telegram_id, values)
+        notify_profile_changed(telegram_id)
+
+    def _cache_user(self, user: User) -> None:
+        # В кэше только отсоединенные объекты: изменения в них не должны попасть в flush чужой сессии
+        if (session := object_session(user)) is not None:
+            session.expunge(user)
+        profile_cache.set(user.telegram_id, user)
+
+    @track_operation
+    async def bulk_upsert(self, users: Iterable[dict], batch_size: int = BULK_BATCH_SIZE) -> int:
+        """Loads users through COPY into a temporary table and upserts them on telegram_id.
+
+        `users` is consumed lazily, one batch per transaction, so memory stays bounded by batch_size.
+        Subjects and location are normalized exactly like create_user does. Listeners are notified of
+        every upserted user after the batch commits; a separate process (users_io) has none registered.
+        """
+        users = iter(users)
+        total = 0
+        while batch := list(islice(users, batch_size)):
+            records = [
+                (
+                    int(user["telegram_id"]),
+                    user.get("username") or None,
+                    user["location"],
+                    normalize_location(user["location"]),
+                    user["language"],
+                    user["gender"],
+                    int(user["age"]),
+                    normalize_subjects(user["subjects"]),
+                    subjects_to_mask(user["subjects"]),
+                )
+                for user in batch
+            ]
+
+            await self.session.execute(text(
+                "CREATE TEMP TABLE users_import ("
+                "telegram_id bigint, username varchar, location varchar, location_key varchar, "
+                "language varchar, gender varchar, age integer, subjects varchar[], subjects_mask integer"
+                ") ON COMMIT DROP"
+            ))
+            connection = await self.session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                "users_import", records=records, columns=IMPORT_COLUMNS
+            )
+            # Старые значения обновляемых строк для дельты счетчиков, строки блокируются до commit
+            old_result = await self.session.execute(text(
+                "SELECT telegram_id, location_key, language, age, subjects FROM users "
+                "WHERE telegram_id IN (SELECT telegram_id FROM users_import) ORDER BY telegram_id FOR UPDATE"
+            ))
+            old = rows_to_profiles(old_result.all())
+            columns = ", ".join(IMPORT_COLUMNS)
+            updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in IMPORT_COLUMNS[1:])
+            updates += ", version = users.version + 1"
+            # DISTINCT ON: одна строка на telegram_id, иначе ON CONFLICT не сможет обновить строку дважды
+            result = await self.session.execute(text(
+                f"INSERT INTO users ({columns}) "
+                f"SELECT DISTINCT ON (telegram_id) {columns} FROM users_import ORDER BY telegram_id "
+                f"ON CONFLICT (telegram_id) DO UPDATE SET {updates} "
+                f"RETURNING id, telegram_id, age, location, location_key, language, subjects, subjects_mask"
+            ))
+            rows = result.all()
+            delta = Counter()
+            for row in rows:
+                delta.update(profile_delta(old.get(row.telegram_id), profile_of(row)))
+            await apply_delta(self.session, delta)
+            await self.session.commit()
+            aggregates.apply(delta)
+            search_cache.bump()
+
+            engine = get_engine()
+            for row in rows:
+                profile_cache.pop(row.telegram_id)
+                if engine:
+                    engine.upsert(row)
+                notify_profile_changed(row.telegram_id)
+            total += len(rows)
+        return total
+
+    async def copy_users_to_csv(self, output) -> None:
+        """Streams all users as CSV with COPY; subjects are joined with ';'"""
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_from_query(
+            "SELECT telegram_id, username, location, language, gender, age, "
+            "array_to_string(subjects, ';') AS subjects FROM users ORDER BY id",
+            output=output, format="csv", header=True,
+        )
+
+    async def iter_users(self, batch_size: int = BULK_BATCH_SIZE):
+        """Streams all users in id order without loading the table into memory"""
+        query = select(User).order_by(User.id).execution_options(yield_per=batch_size)
+        result = await self.session.stream_scalars(query)
+        async for user in result:
+            yield user
+
+    async def prime_statements(self) -> None:
+        """Runs the hot read queries once so the connection has them prepared and their types introspected.
+
+        telegram_id 0 and negative ids never exist, so nothing is returned or cached.
+        """
+        await self.get_user_by_telegram_id(0)
+        await self._load_ids(age_condition(0, 0), search_cache.max_entry_ids + 1)
+        await self._load_ids(location_condition(""), search_cache.max_entry_ids + 1)
+        await self._load_ids(subjects_condition([]), search_cache.max_entry_ids + 1)
+        await self._fetch_query_page(0, age_condition(0, 0), None, None, PAGE_SIZE)
+        # IN (...) раскрывается по числу id, чаще всего запрашивается полная страница
+        await self._fetch_page_by_ids(range(-PAGE_SIZE, 0), None, None, PAGE_SIZE)
+        await self.find_best_matches(0)
+        await self.find_precomputed_matches(0)
+
+    async def _load_ids(self, condition, limit: int) -> array:
+        """The first `limit` matching User.id in ascending order, the shared search_cache entry for one query"""
+        result = await self.read_session.execute(candidate_ids_query(condition).limit(limit))
+        return array("q", result.scalars().all())
+
+    async def _fetch_query_page(self, telegram_id: int, condition, after_id: int | None, before_id: int | None,
+                                limit: int, exclude_seen: bool = False) -> MatchPage:
+        """Keyset page filtered in SQL, for searches with too many results to keep in search_cache"""
+        # Просмотренные пропускаются только при движении вперед, как в _fetch_candidates_page
+        bits = await self._seen_bits(telegram_id) if exclude_seen and before_id is None else None
+        return await self._fetch_page(search_page_query(telegram_id, condition, bits), after_id, before_id, limit)
+
+    async def _fetch_page(self, query: Select, after_id: int | None, before_id: int | None,
+                          limit: int) -> MatchPage:
+        """Keyset pagination over User.id: fetches one extra row to know whether more pages exist"""
+        backwards = before_id is not None
+        result = await self.read_session.execute(keyset_page_query(query, after_id, before_id, limit))
+        users = list(result.scalars().all())
+        has_more = len(users) > limit
+        users = users[:limit]
+
+        if not users:
+            return MatchPage(users=[])
+
+        if backwards:
+            users.reverse()
+            return MatchPage(
+                users=users,
+                next_cursor=users[-1].id,
+                prev_cursor=users[0].id if has_more else None
+            )
+
+        return MatchPage(
+            users=users,
+            next_cursor=users[-1].id if has_more else None,
+            prev_cursor=users[0].id if after_id is not None else None
+        )
+
+    async def _fetch_shared_page(self, telegram_id: int, ids: array, after_id: int | None, before_id: int | None,
+                                 limit: int, exclude_seen: bool = False) -> MatchPage:
+        # Кэшированный список общий для всех, поэтому самого пользователя исключаем только здесь
+        requester = await self.get_user_by_telegram_id(telegram_id)
+        ids = without(ids, requester.id if requester else None)
+        return await self._fetch_candidates_page(telegram_id, ids, after_id, before_id, limit, exclude_seen)
+
+    async def _fetch_candidates_page(self, telegram_id: int, ids: Sequence[int], after_id: int | None,
+                                 before_id: int | None, limit: int, exclude_seen: bool) -> MatchPage:
+        # Просмотренные пропускаются только при движении вперед: "Назад" возвращает уже показанные страницы
+        if exclude_seen and before_id is None:
+            return await self._fetch_unseen_page(telegram_id, ids, after_id, limit)
+        return await self._fetch_page_by_ids(ids, after_id, before_id, limit)
+
+    async def _fetch_unseen_page(self, telegram_id: int, ids: Sequence[int], after_id: int | None,
+                                 limit: int) -> MatchPage:
+        """Keyset page after `after_id` over candidate ids, skipping those in the requester's seen filter.
+
+        The filter is tested in SQL, chunk by chunk of UNSEEN_SCAN_CHUNK ids, until the page is full.
+        One extra unseen row is fetched to know whether more pages exist.
+        """
+        bits = await self._seen_bits(telegram_id)
+        if bits is None:
+            return await self._fetch_page_by_ids(ids, after_id, None, limit)
+
+        start = bisect_right(ids, after_id) if after_id is not None else 0
+        users: list[User] = []
+        while start < len(ids) and len(users) <= limit:
+            chunk = [int(user_id) for user_id in ids[start:start + UNSEEN_SCAN_CHUNK]]
+            start += len(chunk)
+            result = await self.read_session.execute(unseen_chunk_query(chunk, bits, limit + 1 - len(users)))
+            users.extend(result.scalars().all())
+
+        has_more = len(users) > limit
+        users = users[:limit]
+        if not users:
+            return MatchPage(users=[])
+        return MatchPage(users=users, next_cursor=users[-1].id if has_more else None,
+                         prev_cursor=users[0].id if after_id is not None else None)
+
+    async def _fetch_page_by_ids(self, ids: Sequence[int], after_id: int | None, before_id: int | None,
+                                 limit: int) -> MatchPage:
+        """Keyset page over candidate ids computed outside the database, loads only that page's rows"""
+        ids, next_cursor, prev_cursor = page_ids(ids, after_id, before_id, limit)
+        if not len(ids):
+            return MatchPage(users=[])
+
+        result = await self.read_session.execute(ids_page_query(ids))
+        return MatchPage(users=list(result.scalars().all()), next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.bot.scoring import AGE_DISTANCE_WEIGHT, SAME_LANGUAGE_WEIGHT, SAME_LOCATION_WEIGHT, SHARED_SUBJECT_WEIGHT
+from app.bot.write_behind import write_behind_queue
+from app.config import settings
+from app.models import User
+from app.utils.validation import VALID_COUNTRIES, VALID_LANGUAGES, normalize_location, subjects_to_mask
+
+# numpy нужен только для движка сопоставления: без него бот работает и запускается быстрее
+np = None
+if settings.MATCHING_ENGINE_ENABLED:
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+
+UNKNOWN_CODE = -1
+
+COUNTRY_CODES = {normalize_location(country): code for code, country in enumerate(sorted(VALID_COUNTRIES))}
+LANGUAGE_CODES = {language: code for code, language in enumerate(sorted(VALID_LANGUAGES))}
+
+LOAD_BATCH_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def page_ids(ids: Sequence[int], after_id: int | None, before_id: int | None,
+             limit: int) -> tuple[Sequence[int], int | None, int | None]:
+    """Keyset page over an ascending id sequence, same cursor semantics as UserRepository._fetch_page"""
+    if before_id is not None:
+        end = bisect_left(ids, before_id)
+        start = max(0, end - limit)
+        page = ids[start:end]
+        if not len(page):
+            return page, None, None
+        return page, int(page[-1]), int(page[0]) if start > 0 else None
+
+    start = bisect_right(ids, after_id) if after_id is not None else 0
+    end = start + limit
+    page = ids[start:end]
+    if not len(page):
+        return page, None, None
+    return page, int(page[-1]) if end < len(ids) else None, int(page[0]) if after_id is not None else None
+
+
+class MatchingEngine:
+    """Columnar in-memory snapshot of the users table answering find_matches_* with vectorized filters.
+
+    Rows are kept in ascending User.id order so a filtered id column is directly keyset-paginable.
+
+    Writes of this process are applied right away. Rows written by other processes (supervisor
+    workers, webhook replicas, users_io) are read every `refresh_interval` seconds by users.updated_at;
+    the watermark lags by `refresh_overlap` seconds, so transactions committed after a later-started
+    one are not missed. Deleted users disappear with the full reload every `reload_interval` seconds.
+    """
+
+    def __init__(self, capacity: int = 1024,
+                 refresh_interval: float = settings.MATCHING_ENGINE_REFRESH_INTERVAL,
+                 refresh_overlap: float = settings.MATCHING_ENGINE_REFRESH_OVERLAP,
+                 reload_interval: float = settings.MATCHING_ENGINE_RELOAD_INTERVAL):
+        self.ready = False
+        self.refresh_interval = refresh_interval
+        self.refresh_overlap = refresh_overlap
+        self.reload_interval = reload_interval
+        self.watermark: datetime | None = None
+        self._size = 0
+        self._sorted = True
+        self._rows: dict[int, int] = {}
+        self._task: asyncio.Task | None = None
+        self._allocate(capacity)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _allocate(self, capacity: int) -> None:
+        self.ids = np.zeros(capacity, dtype=np.int32)
+        self.telegram_ids = np.zeros(capacity, dtype=np.int64)
+        self.ages = np.zeros(capacity, dtype=np.int8)
+        self.countries = np.full(capacity, UNKNOWN_CODE, dtype=np.int8)
+        self.languages = np.full(capacity, UNKNOWN_CODE, dtype=np.int8)
+        self.subjects = np.zeros(capacity, dtype=np.uint32)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        columns = ("ids", "telegram_ids", "ages", "countries", "languages", "subjects", "alive")
+        old = {name: getattr(self, name) for name in columns}
+        self._allocate(max(1024, len(self.ids) * 2))
+        for name, column in old.items():
+            getattr(self, name)[:self._size] = column[:self._size]
+
+    def _resort(self) -> None:
+        order = np.argsort(self.ids[:self._size], kind="stable")
+        for name in ("ids", "telegram_ids", "ages", "countries", "languages", "subjects", "alive"):
+            column = getattr(self, name)
+            column[:self._size] = column[:self._size][order]
+        self._rows = {int(tg_id): row for row, tg_id in enumerate(self.telegram_ids[:self._size])}
+        self._sorted = True
+
+    async def load(self, session: AsyncSession) -> None:
+        """Builds the snapshot by streaming the users table in id order; searches use the old one meanwhile"""
+        query = (
+            select(User.id, User.telegram_id, User.age, User.location, User.language, User.subjects_mask)
+            .order_by(User.id)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        snapshot = MatchingEngine()
+        watermark = await session.scalar(select(func.now()))
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            for row in rows:
+                snapshot._store(*row)
+
+        # Подмена без await между присваиваниями: поиск видит либо старый, либо новый снимок целиком
+        for name in ("ids", "telegram_ids", "ages", "countries", "languages", "subjects", "alive",
+                     "_size", "_sorted", "_rows"):
+            setattr(self, name, getattr(snapshot, name))
+        self.watermark = watermark
+        self.ready = True
+        # Изменения, записанные во время загрузки, придут со следующим refresh
+        self._apply_pending(self._rows)
+
+    async def refresh(self, session: AsyncSession) -> int:
+        """Applies rows changed since the watermark, returns how many were read"""
+        watermark = await session.scalar(select(func.now()))
+        query = (
+            select(User.id, User.telegram_id, User.age, User.location, User.language, User.subjects_mask)
+            .where(User.updated_at > self.watermark - timedelta(seconds=self.refresh_overlap))
+            .order_by(User.id)
+        )
+        rows = (await session.execute(query)).all()
+        for row in rows:
+            self._store(*row)
+        self._apply_pending(row.telegram_id for row in rows)
+        self.watermark = watermark
+        return len(rows)
+
+    def _apply_pending(self, telegram_ids) -> None:
+        # Строка из БД не должна затереть изменения этого процесса, еще ждущие записи
+        if write_behind_queue is None:
+            return
+        for telegram_id in telegram_ids:
+            if pending := write_behind_queue.pending_for(telegram_id):
+                self.update_fields(telegram_id, pending)
+
+    def start(self, session_pool: async_sessionmaker) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(session_pool))
+
+    async def _run(self, session_pool: async_sessionmaker) -> None:
+        loop = asyncio.get_running_loop()
+        reload_at = loop.time() + self.reload_interval
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                async with session_pool() as session:
+                    if loop.time() >= reload_at:
+                        await self.load(session)
+                        reload_at = loop.time() + self.reload_interval
+                    else:
+                        await self.refresh(session)
+            except Exception:
+                logger.exception("Не удалось обновить движок сопоставления")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def upsert(self, user: User) -> None:
+        if self.ready:
+            self._store(user.id, user.telegram_id, user.age, user.location, user.language, user.subjects_mask)
+
+    def update_fields(self, telegram_id: int, values: dict) -> None:
+        """Applies a partial profile change, e.g. one queued for write-behind"""
+        row = self._rows.get(telegram_id) if self.ready else None
+        if row is None:
+            return
+        if "age" in values:
+            self.ages[row] = values["age"]
+        if "location" in values:
+            self.countries[row] = COUNTRY_CODES.get(normalize_location(values["location"]), UNKNOWN_CODE)
+        if "language" in values:
+            self.languages[row] = LANGUAGE_CODES.get(values["language"], UNKNOWN_CODE)
+        if "subjects_mask" in values:
+            self.subjects[row] = values["subjects_mask"]
+
+    def _store(self, user_id: int, telegram_id: int, age: int, location: str, language: str,
+               subjects_mask: int) -> None:
+        row = self._rows.get(telegram_id)
+        if row is None:
+            if self._size == len(self.ids):
+                self._grow()
+            row = self._size
+            self._size += 1
+            if row and user_id < self.ids[row - 1]:
+                self._sorted = False
+            self._rows[telegram_id] = row
+
+        self.ids[row] = user_id
+        self.telegram_ids[row] = telegram_id
+        self.ages[row] = age
+        self.countries[row] = COUNTRY_CODES.get(normalize_location(location), UNKNOWN_CODE)
+        self.languages[row] = LANGUAGE_CODES.get(language, UNKNOWN_CODE)
+        self.subjects[row] = subjects_mask
+        self.alive[row] = True
+
+    def _ensure_sorted(self) -> None:
+        # До нарезки столбцов: маска, посчитанная по несортированным строкам, не подходит к пересортированным id
+        if not self._sorted:
+            self._resort()
+
+    def _candidates(self, telegram_id: int, mask) -> "np.ndarray":
+        size = self._size
+        mask &= self.alive[:size]
+        mask &= self.telegram_ids[:size] != telegram_id
+        return self.ids[:size][mask]
+
+    def match_age(self, telegram_id: int, target_age: int, range: int) -> "np.ndarray":
+        low = max(target_age - range, np.iinfo(np.int8).min)
+        high = min(target_age + range, np.iinfo(np.int8).max)
+        self._ensure_sorted()
+        ages = self.ages[:self._size]
+        return self._candidates(telegram_id, (ages >= low) & (ages <= high))
+
+    def match_location(self, telegram_id: int, location: str) -> "np.ndarray":
+        code = COUNTRY_CODES.get(normalize_location(location))
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        self._ensure_sorted()
+        return self._candidates(telegram_id, self.countries[:self._size] == code)
+
+    def match_subjects(self, telegram_id: int, subjects: Sequence[str], min_shared: int = 1) -> "np.ndarray":
+        self._ensure_sorted()
+        shared = self.subjects[:self._size] & np.uint32(subjects_to_mask(subjects))
+        if min_shared <= 1:
+            return self._candidates(telegram_id, shared != 0)
+        return self._candidates(telegram_id, popcount(shared) >= min_shared)
+
+    def match_terms(self, subjects_mask: int, location_keys: Sequence[str]) -> "np.ndarray":
+        """Any of the subjects or any of the countries; nobody is excluded"""
+        self._ensure_sorted()
+        size = self._size
+        mask = (self.subjects[:size] & np.uint32(subjects_mask)) != 0
+        codes = [COUNTRY_CODES[key] for key in location_keys if key in COUNTRY_CODES]
+        if codes:
+            mask |= np.isin(self.countries[:size], codes)
+        return self._candidates(0, mask)
+
+    def best_matches(self, telegram_id: int, limit: int) -> list[int]:
+        """Ids of the top `limit` candidates by match score, best first; ties broken by id like the SQL path"""
+        self._ensure_sorted()
+        row = self._rows.get(telegram_id)
+        if row is None:
+            return []
+
+        size = self._size
+        shared = self.subjects[:size] & self.subjects[row]
+        rows = np.flatnonzero((shared != 0) & self.alive[:size] & (self.telegram_ids[:size] != telegram_id))
+        if not len(rows):
+            return []
+
+        # Неизвестная страна не совпадает ни с какой, как NULL в location_key = location_key у match_score
+        country = self.countries[row]
+        scores = (
+            popcount(shared[rows]).astype(np.int64) * SHARED_SUBJECT_WEIGHT
+            + ((self.countries[rows] == country) & (country != UNKNOWN_CODE)) * SAME_LOCATION_WEIGHT
+            + (self.languages[rows] == self.languages[row]) * SAME_LANGUAGE_WEIGHT
+            - np.abs(self.ages[rows].astype(np.int64) - int(self.ages[row])) * AGE_DISTANCE_WEIGHT
+        )
+        # Один ключ сортировки: сначала счет по убыванию, затем id по возрастанию
+        keys = scores * (1 << 32) - self.ids[rows]
+        if len(keys) > limit:
+            top = np.argpartition(-keys, limit - 1)[:limit]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(-keys[top])]
+        return [int(user_id) for user_id in self.ids[rows[top]]]
+
+
+def popcount(values: "np.ndarray") -> "np.ndarray":
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = values.astype(np.uint32)
+    return sum(_BYTE_POPCOUNT[(values >> shift) & 0xFF] for shift in (0, 8, 16, 24))
+
+
+_BYTE_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8) if np is not None else None
+
+matching_engine = MatchingEngine() if np is not None else None
+
+
+def get_engine() -> MatchingEngine | None:
+    """Returns the engine only once its snapshot is loaded, otherwise searches go to SQL"""
+    if matching_engine is not None and matching_engine.ready:
+        return matching_engine
+    return None
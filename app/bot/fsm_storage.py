@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.cache import TTLCache
+from app.config import settings
+from app.database import ShutdownFlushError, async_session_factory
+from app.models import FsmState
+from app.utils.metrics import track_operation
+
+logger = logging.getLogger(__name__)
+
+# (state, data) одного ключа
+Record = tuple[str | None, dict[str, Any]]
+
+
+class PostgresStorage(BaseStorage):
+    """FSM storage in the fsm_states table with a local cache and batched writes.
+
+    Every handler step calls set_state and update_data back to back; both only change the local
+    record, and the background loop writes all keys changed during `flush_interval` with one
+    INSERT ... ON CONFLICT. Cleared records (no state, no data) are deleted instead. Conversations
+    not touched for `state_ttl` seconds are removed every `cleanup_interval` seconds.
+
+    The cache is only safe while a user's updates are handled by one process (polling or
+    RUN_MODE=supervisor); otherwise set FSM_CACHE_TTL=0 so reads always go to the table.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker,
+                 key_builder: KeyBuilder | None = None,
+                 cache_size: int = settings.FSM_CACHE_SIZE,
+                 cache_ttl: float = settings.FSM_CACHE_TTL,
+                 flush_interval: float = settings.FSM_FLUSH_INTERVAL,
+                 state_ttl: int = settings.FSM_STATE_TTL,
+                 cleanup_interval: float = settings.FSM_CLEANUP_INTERVAL):
+        self.session_pool = session_pool
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.cleanup_interval = cleanup_interval
+        self._pending: dict[str, Record] = {}
+        self._inflight: dict[str, Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    async def _load(self, key: str) -> Record:
+        record = self._pending.get(key) or self._inflight.get(key) or self.cache.get(key)
+        if record is not None:
+            return record
+
+        async with self.session_pool() as session:
+            row = (await session.execute(
+                select(FsmState.state, FsmState.data).where(FsmState.key == key)
+            )).one_or_none()
+        record = (row.state, row.data) if row else (None, {})
+        self.cache.set(key, record)
+        return record
+
+    def _store(self, key: str, record: Record) -> None:
+        self._pending[key] = record
+        self.cache.set(key, record)
+        # Запуск по первой записи: хранилище может использоваться и без start_services (бенчмарки)
+        self.start()
+        self._wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        self._store(storage_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        self._store(storage_key, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return data.copy()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        next_cleanup = time.monotonic() + self.cleanup_interval
+        # Флаг нужен в дополнение к cancel(): в 3.11 wait_for теряет отмену, если событие уже наступило
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.cleanup_interval)
+                # Ждем парную запись шага (set_state + update_data), чтобы записать их одним запросом
+                await asyncio.sleep(self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if time.monotonic() >= next_cleanup:
+                    next_cleanup = time.monotonic() + self.cleanup_interval
+                    await self.cleanup()
+            except Exception:
+                logger.exception("Не удалось записать состояния FSM")
+
+    @track_operation
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            self._inflight, self._pending = self._pending, {}
+            try:
+                await self._write(self._inflight)
+            except Exception:
+                # Более новые записи, сделанные во время сброса, важнее
+                self._pending = {**self._inflight, **self._pending}
+                raise
+            finally:
+                written, self._inflight = len(self._inflight), {}
+            return written
+
+    async def _write(self, batch: dict[str, Record]) -> None:
+        cleared = [key for key, (state, data) in batch.items() if state is None and not data]
+        rows = [
+            {"key": key, "state": state, "data": data}
+            for key, (state, data) in batch.items() if state is not None or data
+        ]
+        async with self.session_pool() as session:
+            if cleared:
+                await session.execute(delete(FsmState).where(FsmState.key.in_(cleared)))
+            if rows:
+                query = insert(FsmState).values(rows)
+                await session.execute(query.on_conflict_do_update(
+                    index_elements=[FsmState.key],
+                    set_={"state": query.excluded.state, "data": query.excluded.data, "updated_at": func.now()},
+                ))
+            await session.commit()
+
+    @track_operation
+    async def cleanup(self) -> int:
+        """Deletes conversations abandoned for longer than state_ttl"""
+        async with self.session_pool() as session:
+            result = await session.execute(
+                delete(FsmState)
+                .where(FsmState.updated_at < func.now() - timedelta(seconds=self.state_ttl))
+                .returning(FsmState.key)
+            )
+            expired = result.scalars().all()
+            await session.commit()
+        for key in expired:
+            if key not in self._pending:
+                self.cache.pop(key)
+        return len(expired)
+
+    async def flush_each(self) -> int:
+        """Writes pending keys one transaction each; keys whose write fails stay pending"""
+        written = 0
+        failed = 0
+        for key in list(self._pending):
+            record = self._pending.pop(key)
+            try:
+                await self._write({key: record})
+            except Exception:
+                failed += 1
+                self._pending.setdefault(key, record)
+                continue
+            written += 1
+        if failed:
+            logger.warning("Не удалось записать состояния FSM %d ключей", failed)
+        return written
+
+    async def close(self) -> None:
+        """Stops the background loop and writes everything still pending.
+
+        After SHUTDOWN_FLUSH_ATTEMPTS failed batches keys are written one by one until SHUTDOWN_TIMEOUT;
+        raises ShutdownFlushError if some states are still not written then.
+        """
+        deadline = time.monotonic() + settings.SHUTDOWN_TIMEOUT
+        if self._task is not None:
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._closing = False
+        attempts = 0
+        while self._pending and attempts < settings.SHUTDOWN_FLUSH_ATTEMPTS:
+            try:
+                await self.flush()
+            except Exception:
+                attempts += 1
+                logger.exception("Не удалось записать состояния FSM при остановке (попытка %d из %d)",
+                                 attempts, settings.SHUTDOWN_FLUSH_ATTEMPTS)
+                await asyncio.sleep(settings.SHUTDOWN_FLUSH_RETRY_DELAY)
+        # Пакет может не проходить из-за одной записи, а БД - вернуться за время остановки
+        while self._pending and time.monotonic() < deadline:
+            await self.flush_each()
+            if self._pending:
+                await asyncio.sleep(settings.SHUTDOWN_FLUSH_RETRY_DELAY)
+        if self._pending:
+            lost, self._pending = len(self._pending), {}
+            raise ShutdownFlushError(f"Потеряны состояния FSM {lost} ключей")
+
+
+fsm_storage = PostgresStorage(async_session_factory) if settings.FSM_STORAGE == "postgres" else None
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.crud import UserRepository, profile_change_listeners
+from app.bot.sender import message_scheduler
+from app.bot.write_behind import write_behind_queue
+from app.config import settings
+from app.database import async_session_factory
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_TEXT = (
+    "🔔 Появился новый партнер по вашим предметам!\n"
+    "📍 Страна: {location}\n"
+    "📅 Возраст: {age}\n"
+    "📚 Предметы: {subjects}\n\n"
+    "Посмотреть подходящих партнеров: /search → «Лучшие совпадения»"
+)
+
+
+class MatchNotifier:
+    """Notifies subscribers when a new or changed profile matches them.
+
+    Every profile change costs one set-based query that both finds and claims the audience; the
+    messages then go out through the send scheduler in batches, and the next batch is queued only
+    when the previous one has been sent, so a broadcast never crowds out interactive replies.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker,
+                 cooldown: int = settings.NOTIFICATION_COOLDOWN,
+                 batch_size: int = settings.NOTIFICATION_BATCH_SIZE):
+        self.session_pool = session_pool
+        self.cooldown = cooldown
+        self.batch_size = batch_size
+        self._events: asyncio.Queue[int] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._bot: Bot | None = None
+
+    def profile_changed(self, telegram_id: int) -> None:
+        self._events.put_nowait(telegram_id)
+
+    def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._bot = bot
+            profile_change_listeners.append(self.profile_changed)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            profile_change_listeners.remove(self.profile_changed)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            telegram_id = await self._events.get()
+            try:
+                await self.broadcast(telegram_id)
+            except Exception:
+                logger.exception("Не удалось разослать уведомления о профиле %s", telegram_id)
+
+    async def broadcast(self, telegram_id: int) -> None:
+        if write_behind_queue is not None:
+            await write_behind_queue.flush()
+
+        async with self.session_pool() as session:
+            repo = UserRepository(session)
+            user = await repo.get_user_by_telegram_id(telegram_id)
+            if user is None:
+                return
+            recipients = await repo.claim_subscribers_matching(telegram_id, self.cooldown)
+
+        text = NOTIFICATION_TEXT.format(location=user.location, age=user.age, subjects=", ".join(user.subjects))
+        for start in range(0, len(recipients), self.batch_size):
+            batch = recipients[start:start + self.batch_size]
+            futures = [future for chat_id in batch for future in message_scheduler.send_text(self._bot, chat_id, text)]
+            await asyncio.gather(*futures, return_exceptions=True)
+
+
+match_notifier = MatchNotifier(async_session_factory) if settings.NOTIFICATIONS_ENABLED else None
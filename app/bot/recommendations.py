@@ -0,0 +1,105 @@
+"""Background maintenance of the materialized user_matches table.
+
+    python -m app.bot.recommendations   # full rebuild, e.g. after enabling the feature
+"""
+import asyncio
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.crud import UserRepository, profile_change_listeners
+from app.bot.write_behind import write_behind_queue
+from app.config import settings
+from app.database import async_session_factory
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationWorker:
+    """Recomputes precomputed match lists only for users affected by profile changes.
+
+    Changes are collected for `interval` seconds; then one query finds the affected owners and their
+    lists are rebuilt in chunks of `batch_size`, each chunk as a single INSERT ... SELECT.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker,
+                 size: int = settings.RECOMMENDATIONS_SIZE,
+                 interval: float = settings.RECOMMENDATIONS_INTERVAL,
+                 batch_size: int = settings.RECOMMENDATIONS_BATCH_SIZE):
+        self.session_pool = session_pool
+        self.size = size
+        self.interval = interval
+        self.batch_size = batch_size
+        self._changed: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def mark_changed(self, telegram_id: int) -> None:
+        self._changed.add(telegram_id)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            profile_change_listeners.append(self.mark_changed)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            profile_change_listeners.remove(self.mark_changed)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Собираем изменения за интервал, чтобы пересчитать их одним проходом
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            changed, self._changed = list(self._changed), set()
+            try:
+                await self.process(changed)
+            except Exception:
+                logger.exception("Не удалось пересчитать рекомендации")
+                self._changed.update(changed)
+
+    async def process(self, telegram_ids: list[int]) -> None:
+        if not telegram_ids:
+            return
+        # Отложенные изменения профилей должны быть в БД до пересчета
+        if write_behind_queue is not None:
+            await write_behind_queue.flush()
+
+        async with self.session_pool() as session:
+            repo = UserRepository(session)
+            owner_ids = await repo.find_affected_owner_ids(telegram_ids, self.size)
+            for start in range(0, len(owner_ids), self.batch_size):
+                await repo.refresh_precomputed_matches(owner_ids[start:start + self.batch_size], self.size)
+
+    async def rebuild_all(self) -> None:
+        async with self.session_pool() as session:
+            repo = UserRepository(session)
+            last_id = 0
+            while True:
+                result = await session.execute(
+                    select(User.id).where(User.id > last_id).order_by(User.id).limit(self.batch_size)
+                )
+                user_ids = list(result.scalars().all())
+                if not user_ids:
+                    break
+                await repo.refresh_precomputed_matches(user_ids, self.size)
+                last_id = user_ids[-1]
+                logger.info("Пересчитаны рекомендации до пользователя %s", last_id)
+
+
+recommendation_worker = RecommendationWorker(async_session_factory) if settings.RECOMMENDATIONS_ENABLED else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(RecommendationWorker(async_session_factory).rebuild_all())
@@ -0,0 +1,108 @@
+import sys
+from collections import OrderedDict
+from typing import Iterable
+
+from app.config import settings
+from app.models import User
+
+# Шаблоны разбираются один раз: str.format уже привязан к строке
+_CARD = (
+    "🎓 Партнер\n"
+    "📍 Страна: {location}\n"
+    "🗣️ Язык: {language}\n"
+    "📅 Возраст: {age}\n"
+    "📚 Предметы: {subjects}\n"
+    "{contact}\n"
+    "\n"
+).format
+_USERNAME_CONTACT = "Профиль: @{}".format
+_ID_CONTACT = "Telegram ID: {}".format
+_OWN_PROFILE = (
+    "\n"
+    "📋 Ваш текущий профиль:\n"
+    "📍 Страна: {location}\n"
+    "🗣️ Язык: {language}\n"
+    "📅 Возраст: {age}\n"
+    "📚 Предметы: {subjects}\n"
+    "\n"
+    "Выберите, что хотите изменить:\n"
+).format
+
+PAGE_HEADER = "Найдены следующие партнеры:\n\n"
+
+
+def render_card(user: User) -> str:
+    return _CARD(
+        location=user.location,
+        language=user.language,
+        age=user.age,
+        subjects=", ".join(user.subjects),
+        contact=_USERNAME_CONTACT(user.username) if user.username else _ID_CONTACT(user.telegram_id),
+    )
+
+
+def render_own_profile(user: User) -> str:
+    return _OWN_PROFILE(
+        location=user.location,
+        language=user.language,
+        age=user.age,
+        subjects=", ".join(user.subjects),
+    )
+
+
+class CardCache:
+    """LRU cache of rendered partner cards, bounded by the memory the strings take.
+
+    An entry is valid for one profile version: every write to the users table bumps User.version,
+    so a card rendered from an older row is simply re-rendered and replaced.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._cards: OrderedDict[int, tuple[int, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def card(self, user: User) -> str:
+        entry = self._cards.get(user.id)
+        if entry is not None and entry[0] == user.version:
+            self._cards.move_to_end(user.id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        card = render_card(user)
+        if entry is not None:
+            self.bytes -= sys.getsizeof(entry[1])
+        self._cards[user.id] = (user.version, card)
+        self._cards.move_to_end(user.id)
+        self.bytes += sys.getsizeof(card)
+        while self.bytes > self.max_bytes and self._cards:
+            _, (_, evicted) = self._cards.popitem(last=False)
+            self.bytes -= sys.getsizeof(evicted)
+            self.evictions += 1
+        return card
+
+    def page(self, users: Iterable[User]) -> str:
+        return PAGE_HEADER + "".join([self.card(user) for user in users])
+
+    def clear(self) -> None:
+        self._cards.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._cards),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+card_cache = CardCache(max_bytes=settings.RENDER_CACHE_MAX_BYTES)
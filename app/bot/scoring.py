@@ -0,0 +1,6 @@
+"""Weights of the "best matches" score, used by match_score in SQL and by MatchingEngine.best_matches"""
+
+SHARED_SUBJECT_WEIGHT = 10
+SAME_LOCATION_WEIGHT = 5
+SAME_LANGUAGE_WEIGHT = 3
+AGE_DISTANCE_WEIGHT = 1
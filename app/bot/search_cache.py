@@ -0,0 +1,166 @@
+import asyncio
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable
+
+from app.bot.cache import TTLCache
+from app.config import settings
+
+# Поля users, от которых зависит состав результатов поиска каждого вида (первый элемент ключа)
+KIND_FIELDS = {
+    "age": {"age"},
+    "location": {"location", "location_key"},
+    "subjects": {"subjects", "subjects_mask"},
+}
+
+
+def without(ids: array, user_id: int | None) -> array:
+    """The ascending id list minus one id; the shared entry itself is never modified"""
+    if user_id is None:
+        return ids
+    index = bisect_left(ids, user_id)
+    if index == len(ids) or ids[index] != user_id:
+        return ids
+    return ids[:index] + ids[index + 1:]
+
+
+class SearchResultCache:
+    """Candidate id lists of find_matches_* keyed by (search type, normalized parameter).
+
+    Entries hold every matching User.id in ascending order, including the requester, so one entry
+    serves everyone running the same search; the requester is removed at read time. Every search
+    type has its own version, bumped only by changes of the fields in KIND_FIELDS, so an update of
+    e.g. the language keeps all entries. Versions are per process, so `ttl` bounds how long changes
+    made by other processes (or lagging replicas) can be hidden.
+
+    A load reads at most `max_entry_ids` + 1 ids. A larger result is not cached: get() returns None
+    and the key is remembered as oversized for `ttl`, so its searches page in SQL without loading ids.
+
+    Concurrent misses on one key share a single load: the first caller queries the database, the
+    rest wait for its result.
+    """
+
+    def __init__(self, max_ids: int, max_entry_ids: int, ttl: float):
+        self.max_ids = max_ids
+        self.max_entry_ids = min(max_entry_ids, max_ids)
+        self.ttl = ttl
+        self.versions = dict.fromkeys(KIND_FIELDS, 0)
+        self.size = 0
+        self._entries: OrderedDict[Hashable, tuple[int, float, array]] = OrderedDict()
+        self._oversized = TTLCache(maxsize=settings.SEARCH_CACHE_OVERSIZED_KEYS, ttl=ttl)
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.oversized = 0
+
+    def bump(self, fields: Iterable[str] | None = None) -> None:
+        """Invalidates the search types that depend on the changed fields; None (a new user) - all of them"""
+        fields = None if fields is None else set(fields)
+        for kind, depends_on in KIND_FIELDS.items():
+            if fields is None or depends_on & fields:
+                self.versions[kind] += 1
+
+    def version(self, kind: str) -> int:
+        return self.versions[kind]
+
+    def _lookup(self, key: Hashable) -> array | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, expires_at, ids = entry
+        if version != self.version(key[0]) or expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return ids
+
+    def _store(self, key: Hashable, version: int, ids: array) -> None:
+        self._remove(key)
+        self._entries[key] = (version, time.monotonic() + self.ttl, ids)
+        self.size += len(ids)
+        while self.size > self.max_ids:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+
+    async def get(self, key: Hashable, load: Callable[[int], Awaitable[array]]) -> array | None:
+        """The cached ids of `key`, loaded with `load(limit)` on a miss; None if there are more than max_entry_ids"""
+        while True:
+            ids = self._lookup(key)
+            if ids is not None:
+                self.hits += 1
+                return ids
+            if self._oversized.get(key) == self.version(key[0]):
+                self.oversized += 1
+                return None
+
+            loading = self._loading.get(key)
+            if loading is None:
+                break
+            self.shared += 1
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # Отменили загружающего, а не нас - пробуем сами
+                if not loading.cancelled():
+                    raise
+
+        self.misses += 1
+        version = self.version(key[0])
+        loading = asyncio.get_running_loop().create_future()
+        # Ошибку получат ожидающие; если их нет, она не должна попасть в лог как необработанная
+        loading.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._loading[key] = loading
+        try:
+            ids = await load(self.max_entry_ids + 1)
+        except asyncio.CancelledError:
+            loading.cancel()
+            raise
+        except Exception as error:
+            loading.set_exception(error)
+            raise
+        finally:
+            del self._loading[key]
+
+        if len(ids) > self.max_entry_ids:
+            # Неполный список: запоминаем, что этот поиск не кэшируется, и больше его не загружаем
+            ids = None
+            self._oversized.set(key, version)
+        # Изменение профиля во время загрузки могло не попасть в результат
+        elif self.version(key[0]) == version:
+            self._store(key, version, ids)
+        loading.set_result(ids)
+        return ids
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._oversized.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "ids": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "oversized": self.oversized,
+            "evictions": self.evictions,
+        }
+
+
+search_cache = SearchResultCache(max_ids=settings.SEARCH_CACHE_MAX_IDS,
+                                 max_entry_ids=settings.SEARCH_CACHE_MAX_ENTRY_IDS,
+                                 ttl=settings.SEARCH_CACHE_TTL)
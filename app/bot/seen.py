@@ -0,0 +1,62 @@
+"""Bloom filter of partners already shown to a user, stored per user in seen_filters.bits.
+
+Bit positions are computed with the same integer formula here, when marking ids, and in SQL,
+when find_matches_* exclude them:
+
+    position_i(id) = ((id * A_i + B_i) mod (2^31 - 1)) mod (8 * length(bits))
+
+get_bit(bytea, n) numbers bits from the least significant bit of byte n / 8, and add() does the same.
+The searches read the filter from the primary, since replicas may not have the last marked page yet,
+and pass it to the candidate query as a parameter. False positives only hide a partner until the
+filter is reset.
+"""
+from typing import Iterable
+
+from sqlalchemy import BigInteger, ColumnElement, Integer, LargeBinary, and_, cast, func, literal, not_
+
+from app.config import settings
+
+PRIME = 2**31 - 1
+
+# (A, B) каждой хеш-функции; менять нельзя - сохраненные фильтры перестанут совпадать с запросами
+HASHES = (
+    (1_103_515_245, 12_345),
+    (1_664_525, 1_013_904_223),
+    (22_695_477, 1),
+    (134_775_813, 7),
+    (214_013, 2_531_011),
+    (69_069, 1_234_567),
+)[:settings.SEEN_FILTER_HASHES]
+
+FILTER_BYTES = settings.SEEN_FILTER_BITS // 8
+
+
+def positions(user_id: int, size: int) -> list[int]:
+    return [(user_id * a + b) % PRIME % size for a, b in HASHES]
+
+
+def add(bits: bytearray, user_ids: Iterable[int]) -> int:
+    """Sets the bits of every id, returns how many ids were not in the filter yet"""
+    size = len(bits) * 8
+    added = 0
+    for user_id in user_ids:
+        new = False
+        for position in positions(int(user_id), size):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        added += new
+    return added
+
+
+def unseen(candidate_id, bits: bytes) -> ColumnElement[bool]:
+    """SQL condition: the candidate id is not in the filter `bits`"""
+    size = len(bits) * 8
+    # Один параметр на все хеш-функции
+    filter_bits = literal(bits, LargeBinary)
+    tests = [
+        func.get_bit(filter_bits, cast((cast(candidate_id, BigInteger) * a + b) % PRIME % size, Integer)) == 1
+        for a, b in HASHES
+    ]
+    return not_(and_(*tests))
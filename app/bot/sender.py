@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Message
+
+from app.bot.cache import TTLCache
+from app.config import settings
+from app.utils.metrics import Counter, Gauge
+from app.utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+CARD_SEPARATOR = "\n\n"
+
+QUEUE_DEPTH = Gauge("bot_outgoing_queue_depth", "Messages waiting in the outgoing scheduler")
+SENT_MESSAGES = Counter("bot_outgoing_sent_total", "Bot API calls sent by the scheduler", ("result",))
+FLOOD_WAITS = Counter("bot_outgoing_flood_waits_total", "429 responses received by the scheduler")
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT, separator: str = CARD_SEPARATOR) -> list[str]:
+    """Splits text into messages of at most `limit` characters on card boundaries.
+
+    A single card longer than the limit is split on lines, a single line on characters.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    parts: list[str] = []
+    current = ""
+    for card in text.split(separator):
+        candidate = f"{current}{separator}{card}" if current else card
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        if len(card) <= limit:
+            current = card
+        elif separator != "\n":
+            *head, current = split_text(card, limit, "\n")
+            parts.extend(head)
+        else:
+            *head, current = (card[start:start + limit] for start in range(0, len(card), limit))
+            parts.extend(head)
+    if current:
+        parts.append(current)
+    return parts
+
+
+@dataclass
+class OutgoingCall:
+    bot: Bot
+    method: TelegramMethod
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class ChatQueue:
+    calls: deque[OutgoingCall] = field(default_factory=deque)
+    scheduled: bool = False
+
+
+class MessageScheduler:
+    """Central outgoing queue with global and per-chat token buckets.
+
+    Each chat is served by at most one worker at a time, so messages to a chat keep their order.
+    A chat whose bucket is empty is rescheduled instead of blocking a worker; a 429 pauses both
+    buckets for retry_after and puts the call back at the head of its chat queue.
+
+    Handlers send every chat message through it. Callback and inline query answers go directly:
+    Telegram expects them within seconds and they do not count against the chat limits.
+    """
+
+    def __init__(self, workers: int = settings.SEND_WORKERS, global_rate: float = settings.SEND_GLOBAL_RATE,
+                 chat_rate: float = settings.SEND_CHAT_RATE, chat_burst: int = settings.SEND_CHAT_BURST,
+                 max_attempts: int = 3):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = TTLCache(maxsize=100_000, ttl=60)
+        self._chats: dict[int, ChatQueue] = {}
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._depth = 0
+        QUEUE_DEPTH.set_function(lambda: self._depth)
+
+    def __len__(self) -> int:
+        return self._depth
+
+    def submit(self, bot: Bot, chat_id: int, method: TelegramMethod) -> asyncio.Future:
+        """Queues a Bot API call and returns a future with its result; the caller may ignore it"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.setdefault(chat_id, ChatQueue())
+        chat.calls.append(OutgoingCall(bot, method, future))
+        self._depth += 1
+        if not chat.scheduled:
+            chat.scheduled = True
+            self._ready.put_nowait(chat_id)
+        return future
+
+    def send_text(self, bot: Bot, chat_id: int, text: str, **kwargs: Any) -> list[asyncio.Future]:
+        """Queues text split into message-sized parts; keyboards and other options go on the last part"""
+        parts = split_text(text)
+        return [
+            self.submit(bot, chat_id, SendMessage(chat_id=chat_id, text=part, **(kwargs if last else {})))
+            for last, part in ((index == len(parts) - 1, part) for index, part in enumerate(parts))
+        ]
+
+    def answer(self, message: Message, text: str, **kwargs: Any) -> list[asyncio.Future]:
+        """send_text to the chat `message` came from, the queued counterpart of message.answer"""
+        return self.send_text(message.bot, message.chat.id, text, **kwargs)
+
+    def _ensure_started(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self._ready.get()
+            chat = self._chats[chat_id]
+            bucket = self._chat_bucket(chat_id)
+
+            delay = bucket.delay()
+            if delay > 0:
+                loop.call_later(delay, self._ready.put_nowait, chat_id)
+                continue
+
+            await self._global_bucket.acquire()
+            bucket.try_acquire()
+            call = chat.calls.popleft()
+            await self._send(chat_id, call, bucket)
+
+            if chat.calls:
+                self._ready.put_nowait(chat_id)
+            else:
+                del self._chats[chat_id]
+
+    async def _send(self, chat_id: int, call: OutgoingCall, bucket: TokenBucket) -> None:
+        call.attempts += 1
+        try:
+            result = await call.bot(call.method)
+        except TelegramRetryAfter as error:
+            FLOOD_WAITS.inc()
+            bucket.pause(error.retry_after)
+            self._global_bucket.pause(error.retry_after)
+            if call.attempts < self.max_attempts:
+                self._chats[chat_id].calls.appendleft(call)
+                return
+            self._finish(call, error=error)
+        except Exception as error:
+            logger.warning("Не удалось отправить сообщение в чат %s: %s", chat_id, error)
+            self._finish(call, error=error)
+        else:
+            self._finish(call, result=result)
+
+    def _finish(self, call: OutgoingCall, result: Any = None, error: Exception | None = None) -> None:
+        self._depth -= 1
+        SENT_MESSAGES.inc(result="error" if error else "ok")
+        if call.future.done():
+            return
+        if error:
+            call.future.set_exception(error)
+            # Исключение уже залогировано, необработанный future не должен шуметь в логах
+            call.future.exception()
+        else:
+            call.future.set_result(result)
+
+    async def close(self, timeout: float = settings.SHUTDOWN_TIMEOUT) -> None:
+        """Gives queued messages up to `timeout` seconds to go out, then stops the workers"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self._depth and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+message_scheduler = MessageScheduler()
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.bot.crud import UserRepository
+from app.config import settings
+from app.database import async_engine, replica_router
+
+logger = logging.getLogger(__name__)
+
+
+async def _prime(connection: AsyncConnection) -> None:
+    async with AsyncSession(bind=connection) as session:
+        await UserRepository(session).prime_statements()
+        await session.rollback()
+
+
+async def warm_up_pool(engine: AsyncEngine, connections: int = settings.DB_WARMUP_CONNECTIONS) -> None:
+    """Opens `connections` pool connections at once and prepares the repository queries on each.
+
+    The connections are held together so the pool really grows to that size; on release they stay
+    in the pool, and the first users after a restart skip connection setup, asyncpg type
+    introspection and statement preparation.
+    """
+    connections = min(connections, settings.DB_POOL_SIZE)
+    async with AsyncExitStack() as stack:
+        opened = await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(connections)))
+        await asyncio.gather(*(_prime(connection) for connection in opened))
+
+
+async def warm_up() -> None:
+    """Warms the primary pool and every replica pool; an unavailable replica is logged and skipped"""
+    await warm_up_pool(async_engine)
+    if replica_router is not None:
+        results = await asyncio.gather(*(warm_up_pool(engine) for engine in replica_router.engines),
+                                       return_exceptions=True)
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("Не удалось прогреть реплику %s: %s", index, result)
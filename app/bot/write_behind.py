@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any
+
+from sqlalchemy import ARRAY, BigInteger, Integer, String, cast, column, func, update, values
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.aggregates import (
+    AGGREGATED_FIELDS, aggregates, apply_delta, lock_profiles, profile_delta, profile_of,
+)
+from app.bot.search_cache import search_cache
+from app.config import settings
+from app.database import ShutdownFlushError, async_session_factory
+from app.models import User
+from app.utils.metrics import track_operation
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые может менять update_user_field, и их SQL-типы для VALUES
+FIELD_TYPES = {
+    "location": String(),
+    "location_key": String(),
+    "language": String(),
+    "age": Integer(),
+    "subjects": ARRAY(String()),
+    "subjects_mask": Integer(),
+}
+
+
+class WriteBehindQueue:
+    """Coalesces profile field changes per telegram_id and writes them in batches.
+
+    A batch is flushed as one UPDATE ... FROM (VALUES ...) when it reaches `batch_size` users or
+    every `interval` seconds. NULL in a VALUES column means "field not changed", which is safe because
+    every updatable column is NOT NULL.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker,
+                 batch_size: int = settings.WRITE_BEHIND_BATCH_SIZE,
+                 interval: float = settings.WRITE_BEHIND_INTERVAL):
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: dict[int, dict[str, Any]] = {}
+        self._inflight: dict[int, dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, telegram_id: int, changes: dict[str, Any]) -> None:
+        self._pending.setdefault(telegram_id, {}).update(changes)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending_for(self, telegram_id: int) -> dict[str, Any]:
+        """Changes not yet committed for this user, including the batch being flushed right now"""
+        return {**self._inflight.get(telegram_id, {}), **self._pending.get(telegram_id, {})}
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать отложенные изменения профилей")
+
+    @track_operation
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            self._inflight, self._pending = self._pending, {}
+            try:
+                await self._write(self._inflight)
+                # Поиск по БД до этого момента видел старые значения измененных полей
+                search_cache.bump(field for changes in self._inflight.values() for field in changes)
+            except Exception:
+                # Возвращаем изменения в очередь, более новые значения важнее
+                for telegram_id, changes in self._inflight.items():
+                    self._pending[telegram_id] = {**changes, **self._pending.get(telegram_id, {})}
+                raise
+            finally:
+                written, self._inflight = len(self._inflight), {}
+            return written
+
+    async def _write(self, batch: dict[int, dict[str, Any]]) -> None:
+        pending = values(
+            column("telegram_id", BigInteger()),
+            *(column(name, type_) for name, type_ in FIELD_TYPES.items()),
+            name="pending",
+        ).data([
+            (telegram_id, *(changes.get(name) for name in FIELD_TYPES))
+            for telegram_id, changes in batch.items()
+        ])
+        query = (
+            update(User)
+            .where(User.telegram_id == pending.c.telegram_id)
+            .values({
+                # Столбец из одних NULL Postgres считает text, поэтому тип задается явно
+                **{
+                    name: func.coalesce(cast(pending.c[name], type_), getattr(User, name))
+                    for name, type_ in FIELD_TYPES.items()
+                },
+                "version": User.version + 1,
+            })
+            .returning(User.telegram_id, *(getattr(User, name) for name in AGGREGATED_FIELDS))
+            .execution_options(synchronize_session=False)
+        )
+        # Счетчики - только по пользователям, у которых изменились учитываемые в них поля
+        counted = [telegram_id for telegram_id, changes in batch.items() if changes.keys() & set(AGGREGATED_FIELDS)]
+        async with self.session_pool() as session:
+            old = await lock_profiles(session, counted) if counted else {}
+            result = await session.execute(query)
+            delta = Counter()
+            for row in result:
+                if row.telegram_id in old:
+                    delta.update(profile_delta(old[row.telegram_id], profile_of(row)))
+            await apply_delta(session, delta)
+            await session.commit()
+        aggregates.apply(delta)
+
+    async def flush_each(self) -> int:
+        """Writes pending users one transaction each, so one failing row does not hold back the others.
+
+        Users whose write fails stay pending; returns how many were written.
+        """
+        written = 0
+        failed = 0
+        for telegram_id in list(self._pending):
+            changes = self._pending.pop(telegram_id)
+            try:
+                await self._write({telegram_id: changes})
+            except Exception:
+                failed += 1
+                self._pending[telegram_id] = {**changes, **self._pending.get(telegram_id, {})}
+                continue
+            search_cache.bump(changes)
+            written += 1
+        if failed:
+            logger.warning("Не удалось записать отложенные изменения профилей %d пользователей", failed)
+        return written
+
+    async def close(self) -> None:
+        """Stops the background loop and writes everything still pending.
+
+        After SHUTDOWN_FLUSH_ATTEMPTS failed batches users are written one by one until SHUTDOWN_TIMEOUT;
+        raises ShutdownFlushError if some changes are still not written then.
+        """
+        deadline = time.monotonic() + settings.SHUTDOWN_TIMEOUT
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        attempts = 0
+        while self._pending and attempts < settings.SHUTDOWN_FLUSH_ATTEMPTS:
+            try:
+                await self.flush()
+            except Exception:
+                attempts += 1
+                logger.exception("Не удалось записать отложенные изменения профилей при остановке (попытка %d из %d)",
+                                 attempts, settings.SHUTDOWN_FLUSH_ATTEMPTS)
+                await asyncio.sleep(settings.SHUTDOWN_FLUSH_RETRY_DELAY)
+        # Пакет может не проходить из-за одной строки, а БД - вернуться за время остановки
+        while self._pending and time.monotonic() < deadline:
+            await self.flush_each()
+            if self._pending:
+                await asyncio.sleep(settings.SHUTDOWN_FLUSH_RETRY_DELAY)
+        if self._pending:
+            lost, self._pending = len(self._pending), {}
+            raise ShutdownFlushError(f"Потеряны отложенные изменения профилей {lost} пользователей")
+
+
+write_behind_queue = WriteBehindQueue(async_session_factory) if settings.WRITE_BEHIND_ENABLED else None
@@ -1,14 +1,117 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import asyncio
+import itertools
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase, declared_attr
 from app.config import settings
+from app.utils.metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url=url,
+        echo=settings.DB_ECHO,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    instrument_engine(engine)
+    return engine
+
 
-async_engine = create_async_engine(url=settings.DATABASE_URL_asyncpg, echo=True)
+async_engine = _create_engine(settings.DATABASE_URL_asyncpg)
 
 async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
 
+
+class ShutdownFlushError(RuntimeError):
+    """Buffered writes could not be committed before shutdown and were dropped"""
+
+# Реплика считается отстающей по времени последней примененной транзакции. Без новых записей на мастере это время
+# стареет, хотя реплика догнала мастер, поэтому при совпадении принятой и воспроизведенной позиции WAL
+# отставание считается нулевым
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaRouter:
+    """Chooses a read replica session factory for an update, or None to read from the primary.
+
+    Replicas are used round-robin while their lag stays under `max_lag`. A user who wrote within
+    the last `read_your_writes_window` seconds reads from the primary, so they never see their own
+    profile older than what they just saved.
+    """
+
+    def __init__(self, urls: list[str], max_lag: float = settings.REPLICA_MAX_LAG,
+                 read_your_writes_window: float = settings.READ_YOUR_WRITES_WINDOW,
+                 check_interval: float = settings.REPLICA_LAG_CHECK_INTERVAL):
+        self.engines = [_create_engine(url) for url in urls]
+        self.factories = [async_sessionmaker(engine, expire_on_commit=False) for engine in self.engines]
+        self.max_lag = max_lag
+        self.read_your_writes_window = read_your_writes_window
+        self.check_interval = check_interval
+        self.lags = [0.0] * len(self.engines)
+        self._order = itertools.cycle(range(len(self.engines)))
+        self._recent_writes: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def record_write(self, telegram_id: int) -> None:
+        now = time.monotonic()
+        self._recent_writes[telegram_id] = now + self.read_your_writes_window
+        # Периодически выбрасываем истекшие отметки, чтобы словарь не рос бесконечно
+        if len(self._recent_writes) > 10_000:
+            self._recent_writes = {key: until for key, until in self._recent_writes.items() if until > now}
+
+    def pick(self, telegram_id: int | None) -> async_sessionmaker | None:
+        if telegram_id is not None and self._recent_writes.get(telegram_id, 0) > time.monotonic():
+            return None
+        for _ in range(len(self.engines)):
+            index = next(self._order)
+            if self.lags[index] <= self.max_lag:
+                return self.factories[index]
+        return None
+
+    async def check_lag(self) -> None:
+        for index, engine in enumerate(self.engines):
+            try:
+                async with engine.connect() as connection:
+                    self.lags[index] = float(await connection.scalar(REPLICA_LAG_QUERY))
+            except Exception:
+                logger.warning("Реплика %s недоступна", engine.url.host)
+                self.lags[index] = float("inf")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_lag()
+            await asyncio.sleep(self.check_interval)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+
+replica_router = ReplicaRouter(settings.DB_REPLICA_URLS) if settings.DB_REPLICA_URLS else None
+
 class Base(DeclarativeBase):
     __abstract__ = True
 
     @declared_attr.directive
     def __tablename__(cls) -> str:
-        return f"{cls.__name__.lower()}s"
\ No newline at end of file
+        return f"{cls.__name__.lower()}s"
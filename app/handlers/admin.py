@@ -0,0 +1,56 @@
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from app.bot.aggregates import AGE_BAND, COUNTRY, LANGUAGE, SUBJECT, aggregates, country_name
+from app.bot.cache import profile_cache
+from app.bot.render import card_cache
+from app.bot.search_cache import search_cache
+from app.bot.sender import message_scheduler
+from app.config import settings
+from app.utils.metrics import HANDLER_LATENCY, REPOSITORY_LATENCY, Histogram
+
+router = Router()
+router.message.filter(F.from_user.id.in_(settings.ADMIN_IDS))
+
+
+def format_latencies(histogram: Histogram) -> str:
+    lines = []
+    for key in sorted(histogram.series()):
+        p50 = histogram.quantile(0.5, key) * 1000
+        p99 = histogram.quantile(0.99, key) * 1000
+        lines.append(f"• {' / '.join(key)}: n={histogram.count(key)}, p50={p50:.1f} мс, p99={p99:.1f} мс")
+    return "\n".join(lines) or "нет данных"
+
+
+def format_counts(dimension: str, limit: int = 10, name=str) -> str:
+    return ", ".join(f"{name(value)} {count}" for value, count in aggregates.top(dimension, limit)) or "нет данных"
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    cache_stats = profile_cache.stats()
+    card_stats = card_cache.stats()
+    search_stats = search_cache.stats()
+    text = (
+        f"👥 Пользователей: {aggregates.total()}\n"
+        f"• предметы: {format_counts(SUBJECT)}\n"
+        f"• страны: {format_counts(COUNTRY, name=country_name)}\n"
+        f"• языки: {format_counts(LANGUAGE)}\n"
+        f"• возраст: {format_counts(AGE_BAND)}\n\n"
+        "📊 Обработчики (обработчик / состояние):\n"
+        f"{format_latencies(HANDLER_LATENCY)}\n\n"
+        "🗄️ Запросы к БД:\n"
+        f"{format_latencies(REPOSITORY_LATENCY)}\n\n"
+        "👤 Кэш профилей: "
+        f"{cache_stats['size']} записей, попаданий {cache_stats['hits']}, "
+        f"промахов {cache_stats['misses']}, вытеснений {cache_stats['evictions']}\n"
+        "🃏 Кэш карточек: "
+        f"{card_stats['size']} записей, {card_stats['bytes'] / 1024 / 1024:.1f} МБ, "
+        f"попаданий {card_stats['hits']}, промахов {card_stats['misses']}, вытеснений {card_stats['evictions']}\n"
+        "🔎 Кэш поиска: "
+        f"{search_stats['size']} запросов, {search_stats['ids']} id, попаданий {search_stats['hits']}, "
+        f"промахов {search_stats['misses']}, совместных загрузок {search_stats['shared']}, "
+        f"вытеснений {search_stats['evictions']}"
+    )
+    message_scheduler.answer(message, text)
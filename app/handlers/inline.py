@@ -0,0 +1,115 @@
+import asyncio
+
+from aiogram import Router
+from aiogram.types import (
+    InlineQuery, InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent,
+)
+
+from app.bot.cache import TTLCache
+from app.bot.crud import UserRepository
+from app.bot.render import card_cache
+from app.bot.search_cache import search_cache
+from app.config import settings
+from app.utils.validation import SUBJECT_REGISTRY, VALID_COUNTRIES, normalize_location
+
+router = Router()
+
+MIN_PREFIX_LENGTH = 2
+
+
+def _build_prefixes() -> dict[str, tuple[tuple[str, ...], tuple[str, ...]]]:
+    """Every prefix of every subject and country -> (subjects, countries) it can complete to"""
+    completions: dict[str, tuple[set[str], set[str]]] = {}
+    for subject in SUBJECT_REGISTRY:
+        for end in range(MIN_PREFIX_LENGTH, len(subject) + 1):
+            completions.setdefault(subject[:end], (set(), set()))[0].add(subject)
+    for country in VALID_COUNTRIES:
+        key = normalize_location(country)
+        for end in range(MIN_PREFIX_LENGTH, len(key) + 1):
+            completions.setdefault(key[:end], (set(), set()))[1].add(country)
+    return {
+        prefix: (tuple(sorted(subjects)), tuple(sorted(countries)))
+        for prefix, (subjects, countries) in completions.items()
+    }
+
+
+# Словарь предметов и стран закрыт, поэтому все префиксы считаются один раз при импорте
+PREFIXES = _build_prefixes()
+
+# Страницы результатов по (версия данных, предметы, страны, курсор), общие для всех пользователей
+inline_results = TTLCache(maxsize=settings.INLINE_CACHE_SIZE, ttl=settings.INLINE_CACHE_TTL)
+
+# Последний запрос каждого пользователя, пока он ждет паузы в наборе или идет в БД
+_pending: dict[int, asyncio.Task] = {}
+
+
+def resolve_query(query: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Subjects and countries the typed text can mean; several terms are separated by commas"""
+    subjects: set[str] = set()
+    countries: set[str] = set()
+    for part in query.split(","):
+        completion = PREFIXES.get(normalize_location(part))
+        if completion:
+            subjects.update(completion[0])
+            countries.update(completion[1])
+    return tuple(sorted(subjects)), tuple(sorted(countries))
+
+
+async def load_page(repo: UserRepository, subjects: tuple[str, ...], countries: tuple[str, ...],
+                    after_id: int | None) -> tuple[list[InlineQueryResultArticle], list[int]]:
+    """Articles after `after_id` and the telegram_id behind each, up to two more than a page"""
+    key = (search_cache.version("subjects"), search_cache.version("location"), subjects, countries, after_id)
+    page = inline_results.get(key)
+    if page is None:
+        # Две строки сверх страницы: одну может занять сам пользователь, по второй видно, есть ли продолжение
+        users = await repo.find_matches_by_terms(list(subjects), list(countries), after_id=after_id,
+                                                 limit=settings.INLINE_PAGE_SIZE + 2)
+        articles = [
+            InlineQueryResultArticle(
+                id=str(user.id),
+                title=f"{user.age} лет, {user.location}, {user.language}",
+                description=", ".join(user.subjects),
+                input_message_content=InputTextMessageContent(message_text=card_cache.card(user)),
+            )
+            for user in users
+        ]
+        page = (articles, [user.telegram_id for user in users])
+        inline_results.set(key, page)
+    return page
+
+
+@router.inline_query()
+async def process_inline_query(inline_query: InlineQuery, repo: UserRepository):
+    user_id = inline_query.from_user.id
+    # Запрос устарел, как только пользователь напечатал следующий символ
+    if (previous := _pending.get(user_id)) is not None:
+        previous.cancel()
+    current = _pending[user_id] = asyncio.current_task()
+
+    try:
+        await asyncio.sleep(settings.INLINE_DEBOUNCE)
+
+        if not await repo.get_user_by_telegram_id(user_id):
+            await inline_query.answer(
+                [], cache_time=0, is_personal=True,
+                button=InlineQueryResultsButton(text="Сначала зарегистрируйтесь", start_parameter="register"),
+            )
+            return
+
+        subjects, countries = resolve_query(inline_query.query)
+        after_id = int(inline_query.offset) if inline_query.offset.isdigit() else None
+        articles, telegram_ids = await load_page(repo, subjects, countries, after_id)
+    finally:
+        if _pending.get(user_id) is current:
+            del _pending[user_id]
+
+    shown = [article for article, telegram_id in zip(articles, telegram_ids) if telegram_id != user_id]
+    has_more = len(shown) > settings.INLINE_PAGE_SIZE
+    shown = shown[:settings.INLINE_PAGE_SIZE]
+    await inline_query.answer(
+        shown,
+        cache_time=settings.INLINE_CACHE_TIME,
+        # Результаты без самого пользователя, поэтому Telegram должен кэшировать их для каждого отдельно
+        is_personal=True,
+        next_offset=shown[-1].id if shown and has_more else "",
+    )
@@ -2,14 +2,27 @@ from aiogram import Router, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
+from aiogram.filters.callback_data import CallbackData
+from aiogram.methods import DeleteMessage, EditMessageText
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.bot.crud import UserRepository
-from app.database import async_session_factory
+from app.bot.aggregates import COUNTRY, SUBJECT, aggregates, country_name
+from app.bot.crud import UserRepository, MatchPage
+from app.bot.recommendations import recommendation_worker
+from app.bot.render import card_cache
+from app.bot.sender import message_scheduler
+from app.config import settings
+from app.utils.validation import normalize_location, normalize_subjects
 
 router = Router()
 
 
+# Кнопки листания результатов: курсор - id последнего/первого показанного партнера
+class SearchPageCallback(CallbackData, prefix="page"):
+    direction: str
+    cursor: int
+
+
 # Состояния для поиска
 class SearchStates(StatesGroup):
     waiting_for_age = State()
@@ -22,126 +35,213 @@ last_not_found_message = {}
 
 
 @router.message(Command("search"))
-async def cmd_search(message: Message):
-    async with async_session_factory() as session:
-        repo = UserRepository(session)
-        user = await repo.get_user_by_telegram_id(message.from_user.id)
+async def cmd_search(message: Message, repo: UserRepository):
+    user = await repo.get_user_by_telegram_id(message.from_user.id)
 
-        if not user:
-            await message.answer("❌ Вы не зарегистрированы! Пожалуйста, сначала используйте команду /register.")
-            return
+    if not user:
+        message_scheduler.answer(message, "❌ Вы не зарегистрированы! Пожалуйста, сначала используйте команду /register.")
+        return
 
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(text="По возрасту", callback_data="search_age"))
     builder.add(InlineKeyboardButton(text="По стране", callback_data="search_location"))
     builder.add(InlineKeyboardButton(text="По предметам", callback_data="search_subjects"))
+    builder.add(InlineKeyboardButton(text="Лучшие совпадения", callback_data="search_best"))
+    if settings.SEEN_FILTER_ENABLED:
+        builder.add(InlineKeyboardButton(text="🔄 Показывать уже просмотренных", callback_data="search_reset"))
+    builder.adjust(3, 1, 1)
 
-    await message.answer(
+    message_scheduler.answer(
+        message,
         "🔍 Выберите критерий поиска:",
         reply_markup=builder.as_markup()
     )
 
 
 @router.callback_query(F.data.startswith("search_"))
-async def process_search_selection(callback: CallbackQuery, state: FSMContext):
+async def process_search_selection(callback: CallbackQuery, state: FSMContext, repo: UserRepository):
     search_type = callback.data.split("_")[1]
 
     # Проверяем регистрацию пользователя
-    async with async_session_factory() as session:
-        repo = UserRepository(session)
-        if not await repo.get_user_by_telegram_id(callback.from_user.id):
-            await callback.message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью /register")
-            await callback.answer()
-            return
+    if not await repo.get_user_by_telegram_id(callback.from_user.id):
+        message_scheduler.answer(callback.message, "Пожалуйста, сначала зарегистрируйтесь с помощью /register")
+        await callback.answer()
+        return
 
     # Запрашиваем параметры поиска в зависимости от выбранного критерия
     if search_type == "age":
-        await callback.message.answer("Введите желаемый возраст для поиска партнера:")
+        message_scheduler.answer(callback.message, "Введите желаемый возраст для поиска партнера:")
         await state.set_state(SearchStates.waiting_for_age)
     elif search_type == "location":
-        await callback.message.answer("Введите страну для поиска партнера:")
+        message_scheduler.answer(callback.message, "Введите страну для поиска партнера:")
         await state.set_state(SearchStates.waiting_for_location)
     elif search_type == "subjects":
-        await callback.message.answer(
+        message_scheduler.answer(
+            callback.message,
             "Введите предмет или предметы для поиска партнера (через запятую):"
         )
         await state.set_state(SearchStates.waiting_for_subjects)
+    elif search_type == "best":
+        # Параметры не нужны: кандидаты ранжируются по профилю самого пользователя
+        await state.clear()
+        await perform_search(callback.message, state, repo, "best", None, user_id=callback.from_user.id)
+    elif search_type == "reset":
+        await repo.reset_seen(callback.from_user.id)
+        await callback.answer("Список просмотренных партнеров очищен", show_alert=True)
+        return
 
     await callback.answer()
 
 
 @router.message(StateFilter(SearchStates.waiting_for_age))
-async def process_age_search(message: Message, state: FSMContext):
+async def process_age_search(message: Message, state: FSMContext, repo: UserRepository):
     if not message.text.isdigit():
-        await message.answer("Пожалуйста, введите корректный возраст (число):")
+        message_scheduler.answer(message, "Пожалуйста, введите корректный возраст (число):")
         return
 
     age = int(message.text)
     if age < 13 or age > 80:
-        await message.answer("Пожалуйста, введите реалистичный возраст (от 13 до 80):")
+        message_scheduler.answer(message, "Пожалуйста, введите реалистичный возраст (от 13 до 80):")
         return
 
-    await perform_search(message, "age", age)
     await state.clear()
+    await perform_search(message, state, repo, "age", age)
 
 
 @router.message(StateFilter(SearchStates.waiting_for_location))
-async def process_location_search(message: Message, state: FSMContext):
-    await perform_search(message, "location", message.text)
+async def process_location_search(message: Message, state: FSMContext, repo: UserRepository):
     await state.clear()
+    await perform_search(message, state, repo, "location", message.text)
 
 
 @router.message(StateFilter(SearchStates.waiting_for_subjects))
-async def process_subjects_search(message: Message, state: FSMContext):
+async def process_subjects_search(message: Message, state: FSMContext, repo: UserRepository):
     subjects = [s.strip() for s in message.text.split(",")]
-    await perform_search(message, "subjects", subjects)
     await state.clear()
+    await perform_search(message, state, repo, "subjects", subjects)
 
 
-async def perform_search(message: Message, search_type: str, search_param):
-    user_id = message.from_user.id
+@router.callback_query(SearchPageCallback.filter())
+async def process_search_page(callback: CallbackQuery, callback_data: SearchPageCallback, state: FSMContext,
+                              repo: UserRepository):
+    last_search = (await state.get_data()).get("last_search")
+    if not last_search:
+        await callback.answer("Поиск устарел, пожалуйста, повторите /search", show_alert=True)
+        return
 
-    # Удаляем предыдущее сообщение "Не найдено"
+    if callback_data.direction == "next":
+        cursor = {"after_id": callback_data.cursor}
+    else:
+        cursor = {"before_id": callback_data.cursor}
+
+    page = await find_matches(repo, callback.from_user.id, last_search["type"], last_search["param"], **cursor)
+
+    if page.users:
+        summary = search_summary(last_search["type"], last_search["param"])
+        message_scheduler.submit(callback.bot, callback.message.chat.id, EditMessageText(
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.message_id,
+            text=format_page(page, summary),
+            reply_markup=page_keyboard(page)
+        ))
+        if settings.SEEN_FILTER_ENABLED:
+            await repo.mark_seen(callback.from_user.id, [user.id for user in page.users])
+        await callback.answer()
+    else:
+        # Кандидаты могли исчезнуть или уже быть показаны с момента прошлой страницы
+        await callback.answer("Больше никого нет", show_alert=True)
+
+
+async def find_matches(repo: UserRepository, user_id: int, search_type: str, search_param,
+                       after_id: int | None = None, before_id: int | None = None) -> MatchPage:
+    # Уже показанные партнеры пропускаются, чтобы повторный поиск находил новых
+    cursor = {"after_id": after_id, "before_id": before_id, "exclude_seen": settings.SEEN_FILTER_ENABLED}
+    if search_type == "age":
+        return await repo.find_matches_by_age_param(user_id, search_param, **cursor)
+    elif search_type == "location":
+        return await repo.find_matches_by_location_param(user_id, search_param, **cursor)
+    elif search_type == "subjects":
+        return await repo.find_matches_by_subjects_param(user_id, search_param, **cursor)
+    elif search_type == "best":
+        # Быстрый путь: готовый список из user_matches; если его еще нет - считаем на лету
+        if recommendation_worker is not None:
+            page = await repo.find_precomputed_matches(user_id, exclude_seen=settings.SEEN_FILTER_ENABLED)
+            # Все из готового списка уже показаны: список актуален, пересчитывать его незачем
+            if page.users or page.all_seen:
+                return page
+            recommendation_worker.mark_changed(user_id)
+        return await repo.find_best_matches(user_id, exclude_seen=settings.SEEN_FILTER_ENABLED)
+    raise ValueError(f"Unknown search type: {search_type}")
+
+
+def search_summary(search_type: str, search_param) -> str:
+    """How many registered users match the criterion overall, from the in-memory counters"""
+    if not aggregates.loaded:
+        return ""
+    if search_type == "location":
+        location_key = normalize_location(search_param)
+        return f"📍 {country_name(location_key)} — партнеров: {aggregates.count(COUNTRY, location_key)}\n\n"
+    if search_type == "subjects":
+        lines = [
+            f"📚 {subject.capitalize()} — партнеров: {aggregates.count(SUBJECT, subject)}"
+            for subject in dict.fromkeys(normalize_subjects(search_param)) if subject
+        ]
+        return "\n".join(lines) + "\n\n" if lines else ""
+    return ""
+
+
+def format_page(page: MatchPage, summary: str = "") -> str:
+    # Карточки берутся из кэша по (id, version), страница - просто их конкатенация
+    return summary + card_cache.page(page.users)
+
+
+def page_keyboard(page: MatchPage) -> InlineKeyboardMarkup | None:
+    builder = InlineKeyboardBuilder()
+    if page.prev_cursor is not None:
+        builder.add(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=SearchPageCallback(direction="prev", cursor=page.prev_cursor).pack()
+        ))
+    if page.next_cursor is not None:
+        builder.add(InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=SearchPageCallback(direction="next", cursor=page.next_cursor).pack()
+        ))
+    return builder.as_markup() if page.prev_cursor is not None or page.next_cursor is not None else None
+
+
+def remember_not_found(user_id: int, future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        last_not_found_message[user_id] = future.result().message_id
+
+
+async def perform_search(message: Message, state: FSMContext, repo: UserRepository, search_type: str, search_param,
+                         user_id: int | None = None):
+    # Для вызова из callback message.from_user - это сам бот, поэтому id передается явно
+    user_id = user_id or message.from_user.id
+
+    # Удаляем предыдущее сообщение "Не найдено"; ошибку удаления логирует очередь отправки
     if user_id in last_not_found_message:
-        try:
-            await message.bot.delete_message(
-                chat_id=user_id,
-                message_id=last_not_found_message[user_id]
-            )
-        except Exception as e:
-            print(f"Ошибка удаления сообщения: {e}")
-        del last_not_found_message[user_id]
-
-    async with async_session_factory() as session:
-        repo = UserRepository(session)
-
-        # Выполняем поиск в зависимости от типа
-        if search_type == "age":
-            matches = await repo.find_matches_by_age_param(user_id, search_param)
-        elif search_type == "location":
-            matches = await repo.find_matches_by_location_param(user_id, search_param)
-        elif search_type == "subjects":
-            matches = await repo.find_matches_by_subjects_param(user_id, search_param)
-
-        if not matches:
-            msg = await message.answer("К сожалению, подходящих партнеров не найдено.")
-            last_not_found_message[user_id] = msg.message_id
-            return
-
-        # Формируем ответ с найденными партнерами
-        response = "Найдены следующие партнеры:\n\n"
-        for match in matches:
-            response += f"🎓 Партнер\n"
-            response += f"📍 Страна: {match.location}\n"
-            response += f"🗣️ Язык: {match.language}\n"
-            response += f"📅 Возраст: {match.age}\n"
-            response += f"📚 Предметы: {', '.join(match.subjects)}\n"
-
-            if match.username:
-                response += f"Профиль: @{match.username}\n"
-            else:
-                response += f"Telegram ID: {match.telegram_id}\n"
-
-            response += "\n"
-
-        await message.answer(response)
\ No newline at end of file
+        message_scheduler.submit(message.bot, message.chat.id, DeleteMessage(
+            chat_id=user_id,
+            message_id=last_not_found_message.pop(user_id)
+        ))
+
+    page = await find_matches(repo, user_id, search_type, search_param)
+
+    if not page.users:
+        text = "К сожалению, подходящих партнеров не найдено."
+        if settings.SEEN_FILTER_ENABLED:
+            text += "\nУже показанных партнеров можно вернуть кнопкой в /search."
+        sent = message_scheduler.answer(message, text)[-1]
+        # id сообщения известен только после отправки из очереди
+        sent.add_done_callback(lambda future: remember_not_found(user_id, future))
+        return
+
+    # Запоминаем параметры поиска, чтобы кнопки "Далее"/"Назад" могли запросить следующую страницу
+    await state.update_data(last_search={"type": search_type, "param": search_param})
+    # Отправка идет через общую очередь с учетом лимитов Telegram, обработчик не ждет ее
+    text = format_page(page, search_summary(search_type, search_param))
+    message_scheduler.answer(message, text, reply_markup=page_keyboard(page))
+    if settings.SEEN_FILTER_ENABLED:
+        await repo.mark_seen(user_id, [user.id for user in page.users])
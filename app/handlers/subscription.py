@@ -0,0 +1,24 @@
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from app.bot.crud import UserRepository
+from app.bot.sender import message_scheduler
+
+router = Router()
+
+
+@router.message(Command("subscribe"))
+async def cmd_subscribe(message: Message, repo: UserRepository):
+    if not await repo.get_user_by_telegram_id(message.from_user.id):
+        message_scheduler.answer(message, "❌ Вы не зарегистрированы! Пожалуйста, сначала используйте команду /register.")
+        return
+
+    await repo.subscribe(message.from_user.id)
+    message_scheduler.answer(message, "🔔 Готово! Я сообщу, когда появится новый партнер по вашим предметам. Отписаться: /unsubscribe")
+
+
+@router.message(Command("unsubscribe"))
+async def cmd_unsubscribe(message: Message, repo: UserRepository):
+    await repo.unsubscribe(message.from_user.id)
+    message_scheduler.answer(message, "🔕 Уведомления о новых партнерах отключены.")
@@ -1,23 +1,152 @@
 import asyncio
-from aiogram import Bot, Dispatcher
+import sys
+import time
 
+from aiogram import Bot, Dispatcher, BaseMiddleware
+
+from app.bot.aggregates import aggregates
+from app.bot.crud import profile_change_listeners
+from app.bot.engine import matching_engine
+from app.bot.fsm_storage import fsm_storage
+from app.bot.notifications import match_notifier
+from app.bot.recommendations import recommendation_worker
+from app.bot.sender import message_scheduler
+from app.bot.warmup import warm_up
+from app.bot.write_behind import write_behind_queue
 from app.config import settings
+from app.database import ShutdownFlushError, async_engine, async_session_factory, replica_router
 from app.handlers.auth import router as auth_router
+from app.handlers.inline import router as inline_router
 from app.handlers.match import router as match_router
+from app.handlers.subscription import router as subscription_router
 from app.handlers.update import router as update_router
+from app.middlewares.admission import AdmissionMiddleware
+from app.middlewares.database import DbSessionMiddleware
+from app.middlewares.timing import TimingMiddleware
+from app.utils.log import configure_logging
+from app.utils.metrics import serve_metrics, set_ready
+
+
+def build_dispatcher(session_middleware: BaseMiddleware | None = None, admission: bool = True) -> Dispatcher:
+    """Dispatcher with all routers and middlewares; also used by the benchmarks"""
+    dp = Dispatcher(storage=fsm_storage)
+    dp.update.outer_middleware(session_middleware or DbSessionMiddleware(async_session_factory, replica_router))
+    if admission:
+        # Один экземпляр на оба типа событий: лимиты пользователя общие для сообщений и кнопок
+        admission_middleware = AdmissionMiddleware(async_engine)
+        dp.message.outer_middleware(admission_middleware)
+        dp.callback_query.outer_middleware(admission_middleware)
+    dp.include_routers(auth_router, match_router, update_router, subscription_router, inline_router)
+    if settings.ADMIN_IDS:
+        # Без администраторов роутер не нужен, как и его импорт
+        from app.handlers.admin import router as admin_router
+        dp.include_router(admin_router)
+    for router in (auth_router, match_router, update_router):
+        router.message.middleware(TimingMiddleware())
+        router.callback_query.middleware(TimingMiddleware())
+    # start_polling закрывает сессию бота сразу после shutdown-обработчиков, stop_services - уже позже
+    dp.shutdown.register(stop_sending)
+    return dp
+
+
+async def stop_sending() -> None:
+    """Stops the services calling the Bot API and lets queued messages go out while the bot session is open"""
+    if match_notifier is not None:
+        await match_notifier.close()
+    await message_scheduler.close()
+
+
+async def start_services(bot: Bot) -> None:
+    """Starts the optional background components; each process running a Dispatcher calls this once"""
+    await warm_up()
+
+    if settings.MATCHING_ENGINE_ENABLED:
+        if matching_engine is None:
+            print("MATCHING_ENGINE_ENABLED требует numpy, поиск будет выполняться в БД")
+        else:
+            async with async_session_factory() as session:
+                await matching_engine.load(session)
+            matching_engine.start(async_session_factory)
+            print(f"Движок сопоставления загружен: {len(matching_engine)} пользователей")
+
+    await aggregates.load()
+    aggregates.start()
+    if write_behind_queue is not None:
+        write_behind_queue.start()
+    if fsm_storage is not None:
+        fsm_storage.start()
+    if replica_router is not None:
+        profile_change_listeners.append(replica_router.record_write)
+        replica_router.start()
+    if recommendation_worker is not None:
+        recommendation_worker.start()
+    if match_notifier is not None:
+        match_notifier.start(bot)
+
+
+async def stop_services() -> None:
+    if recommendation_worker is not None:
+        await recommendation_worker.close()
+    # Обычно уже вызвано из dp.shutdown; повторный вызов ничего не делает
+    await stop_sending()
+    await aggregates.close()
+    if matching_engine is not None:
+        await matching_engine.close()
+    # Отложенные изменения профилей и состояния FSM записываются до выхода. Если часть потеряна,
+    # остальное все равно закрывается, а ошибка завершает процесс с ненулевым кодом
+    lost: list[ShutdownFlushError] = []
+    for buffer in (write_behind_queue, fsm_storage):
+        if buffer is None:
+            continue
+        try:
+            await buffer.close()
+        except ShutdownFlushError as error:
+            lost.append(error)
+    if replica_router is not None:
+        await replica_router.close()
+    if lost:
+        raise ShutdownFlushError("; ".join(str(error) for error in lost))
 
-# Создание бота
-bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher()
 
 # Функция для запуска бота
 async def main():
-    dp.include_routers(auth_router, match_router, update_router)
-    print("Бот запущен!")
-    await dp.start_polling(bot)
+    configure_logging()
+    if settings.RUN_MODE == "supervisor":
+        from app.supervisor import Supervisor
+        await Supervisor().run()
+        return
+
+    started = time.perf_counter()
+    # Создание бота
+    bot = Bot(token=settings.BOT_TOKEN)
+    dp = build_dispatcher()
+
+    # В режиме webhook /metrics и /ready отдает тот же сервер, при polling - отдельный порт, поднятый до прогрева
+    metrics_runner = None
+    if settings.RUN_MODE != "webhook" and settings.METRICS_PORT:
+        metrics_runner = await serve_metrics(settings.METRICS_HOST, settings.METRICS_PORT)
+    try:
+        await start_services(bot)
+        set_ready(True)
+        print(f"Бот запущен за {time.perf_counter() - started:.2f} с!")
+
+        if settings.RUN_MODE == "webhook":
+            from app.webhook import WebhookRunner
+            await WebhookRunner(dp, bot).run()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        set_ready(False)
+        try:
+            await stop_services()
+        finally:
+            if metrics_runner:
+                await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("Exit")
\ No newline at end of file
+        print("Exit")
+    except ShutdownFlushError as error:
+        sys.exit(f"Остановка с потерей данных: {error}")
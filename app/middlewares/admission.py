@@ -0,0 +1,170 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.bot.cache import TTLCache
+from app.bot.sender import message_scheduler
+from app.config import settings
+from app.utils.metrics import ADMISSION_IN_FLIGHT, ADMISSION_REJECTED
+from app.utils.ratelimit import TokenBucket
+
+# Состояние FSM -> действие, которое выполняет введенный в нем текст
+STATE_ACTIONS = {"SearchStates": "search", "UpdateStates": "update", "RegistrationStates": "register"}
+
+NOTICES = {
+    "rate": "⏳ Слишком много запросов, подождите несколько секунд.",
+    "busy": "⏳ Предыдущий запрос еще выполняется.",
+    "overload": "⚠️ Бот сейчас перегружен, попробуйте чуть позже.",
+}
+
+
+def action_of(event: TelegramObject, raw_state: str | None) -> str:
+    """What the update asks for: a command name, the first token of callback data or the FSM flow"""
+    if isinstance(event, CallbackQuery):
+        return re.split(r"[_:]", event.data or "", maxsplit=1)[0]
+    if event.text and event.text.startswith("/"):
+        return event.text[1:].split(maxsplit=1)[0].split("@")[0].lower()
+    if raw_state:
+        return STATE_ACTIONS.get(raw_state.split(":")[0], "message")
+    return "message"
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """Decides whether a message or callback is run at all, before any handler touches the database.
+
+    In order:
+    - a callback identical to one still running (same user, message and data) is answered and dropped;
+    - every user has a token bucket of `rate` updates per second with bursts of `burst`;
+    - a user runs at most `action_limits[action]` handlers of one action at a time;
+    - once `max_in_flight` handlers run or the engine's pool has no free connection, sheddable
+      actions are deferred: a repeat of the user's previous request is rejected right away, anything
+      else waits up to `queue_timeout` for a free slot. Other actions are always admitted.
+
+    Rejected users get one short notice per `notice_interval`. Register it as an outer middleware of
+    the message and callback_query observers so it sees the resolved FSM state.
+    """
+
+    def __init__(self, engine: AsyncEngine | None = None,
+                 rate: float = settings.ADMISSION_USER_RATE,
+                 burst: int = settings.ADMISSION_USER_BURST,
+                 action_limits: dict[str, int] = settings.ADMISSION_ACTION_LIMITS,
+                 max_in_flight: int = settings.ADMISSION_MAX_IN_FLIGHT,
+                 sheddable_actions: list[str] = settings.ADMISSION_SHEDDABLE_ACTIONS,
+                 queue_timeout: float = settings.ADMISSION_QUEUE_TIMEOUT,
+                 repeat_window: float = settings.ADMISSION_REPEAT_WINDOW,
+                 notice_interval: float = settings.ADMISSION_NOTICE_INTERVAL):
+        self.engine = engine
+        self.pool_capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        self.rate = rate
+        self.burst = burst
+        self.action_limits = action_limits
+        self.max_in_flight = max_in_flight
+        self.sheddable_actions = set(sheddable_actions)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._buckets = TTLCache(maxsize=settings.ADMISSION_STATE_SIZE, ttl=settings.ADMISSION_STATE_TTL)
+        # Последний запрос пользователя: повтор при перегрузке отклоняется первым
+        self._last_request = TTLCache(maxsize=settings.ADMISSION_STATE_SIZE, ttl=repeat_window)
+        self._notified = TTLCache(maxsize=settings.ADMISSION_STATE_SIZE, ttl=notice_interval)
+        self._running_actions: dict[tuple[int, str], int] = {}
+        self._running_callbacks: set[tuple[int, int | None, str | None]] = set()
+        self._released = asyncio.Condition()
+        ADMISSION_IN_FLIGHT.set_function(lambda: self.in_flight)
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets.set(user_id, bucket)
+        return bucket
+
+    def saturated(self) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return True
+        pool = self.engine.pool if self.engine is not None else None
+        return pool is not None and hasattr(pool, "checkedout") and pool.checkedout() >= self.pool_capacity
+
+    async def _wait_for_slot(self) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        async with self._released:
+            while self.saturated():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                # Соединения пула освобождаются и не через этот middleware, поэтому ждем с коротким шагом
+                try:
+                    await asyncio.wait_for(self._released.wait(), timeout=min(remaining, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+        return True
+
+    async def _reject(self, event: TelegramObject, user_id: int, action: str, reason: str) -> None:
+        ADMISSION_REJECTED.inc(action=action, reason=reason)
+        notify = self._notified.get(user_id) is None
+        if notify:
+            self._notified.set(user_id, True)
+        if isinstance(event, CallbackQuery):
+            # На callback нужно ответить в любом случае, иначе у кнопки крутятся часики
+            await event.answer(NOTICES[reason] if notify else None)
+        elif notify:
+            message_scheduler.send_text(event.bot, event.chat.id, NOTICES[reason])
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, (Message, CallbackQuery)):
+            return await handler(event, data)
+
+        action = action_of(event, data.get("raw_state"))
+        if isinstance(event, CallbackQuery):
+            callback_key = (user.id, event.message.message_id if event.message else None, event.data)
+            if callback_key in self._running_callbacks:
+                ADMISSION_REJECTED.inc(action=action, reason="duplicate")
+                await event.answer()
+                return None
+        else:
+            callback_key = None
+
+        if not self._bucket(user.id).try_acquire():
+            return await self._reject(event, user.id, action, "rate")
+
+        action_key = (user.id, action)
+        limit = self.action_limits.get(action)
+        if limit is not None and self._running_actions.get(action_key, 0) >= limit:
+            return await self._reject(event, user.id, action, "busy")
+
+        request = (action, event.data if isinstance(event, CallbackQuery) else event.text)
+        repeat = self._last_request.get(user.id) == request
+        self._last_request.set(user.id, request)
+
+        # Действие и callback заняты уже на время ожидания слота
+        self._running_actions[action_key] = self._running_actions.get(action_key, 0) + 1
+        if callback_key is not None:
+            self._running_callbacks.add(callback_key)
+        try:
+            if action in self.sheddable_actions and self.saturated():
+                if repeat or not await self._wait_for_slot():
+                    return await self._reject(event, user.id, action, "overload")
+
+            self.in_flight += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.in_flight -= 1
+                async with self._released:
+                    self._released.notify_all()
+        finally:
+            if self._running_actions[action_key] == 1:
+                del self._running_actions[action_key]
+            else:
+                self._running_actions[action_key] -= 1
+            self._running_callbacks.discard(callback_key)
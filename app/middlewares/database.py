@@ -0,0 +1,40 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.crud import UserRepository
+from app.database import ReplicaRouter
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Lends each update one AsyncSession and one UserRepository, shared by the whole handler chain.
+
+    The session checks out a pool connection only on its first query, so updates that never
+    touch the database cost nothing. With a replica router the repository also gets a replica
+    session for its read-only queries.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, replica_router: ReplicaRouter | None = None):
+        self.session_pool = session_pool
+        self.replica_router = replica_router
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        read_pool = self.replica_router.pick(user.id if user else None) if self.replica_router else None
+
+        async with self.session_pool() as session:
+            data["session"] = session
+            if read_pool is None:
+                data["repo"] = UserRepository(session)
+                return await handler(event, data)
+
+            async with read_pool() as read_session:
+                data["repo"] = UserRepository(session, read_session=read_session)
+                return await handler(event, data)
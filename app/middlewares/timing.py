@@ -0,0 +1,28 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.utils.metrics import HANDLER_LATENCY
+
+
+class TimingMiddleware(BaseMiddleware):
+    """Records handler latency labelled by handler name and the FSM state it ran in.
+
+    Registered as an inner middleware, so it only sees updates a handler actually matched.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object else "unknown"
+            HANDLER_LATENCY.observe(time.perf_counter() - start, handler=name, state=data.get("raw_state") or "none")
@@ -0,0 +1,52 @@
+"""add search indexes
+
+Revision ID: 2ce49c71f147
+Revises: 589e3949c454
+Create Date: 2025-03-02 18:41:07.215903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2ce49c71f147'
+down_revision: Union[str, None] = '589e3949c454'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('location_key', sa.String(), nullable=True))
+
+    # Backfill and CREATE INDEX CONCURRENTLY must run outside the migration transaction,
+    # so that the table is never locked for the duration of the whole upgrade.
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            result = bind.execute(sa.text(
+                "UPDATE users SET location_key = lower(btrim(location)) "
+                "WHERE id IN (SELECT id FROM users WHERE location_key IS NULL LIMIT :batch_size)"
+            ), {"batch_size": BACKFILL_BATCH_SIZE})
+            if result.rowcount == 0:
+                break
+
+        op.create_index(op.f('ix_users_location_key'), 'users', ['location_key'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_users_age'), 'users', ['age'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_users_subjects', 'users', ['subjects'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_subjects', table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_users_age'), table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_users_location_key'), table_name='users', postgresql_concurrently=True,
+                      if_exists=True)
+    op.drop_column('users', 'location_key')
@@ -0,0 +1,36 @@
+"""create user_matches table
+
+Revision ID: 7b1d5e0a9c3f
+Revises: 2ce49c71f147
+Create Date: 2025-03-15 12:07:44.581230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1d5e0a9c3f'
+down_revision: Union[str, None] = '2ce49c71f147'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_matches',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.Column('candidate_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['candidate_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'rank')
+    )
+    op.create_index(op.f('ix_user_matches_candidate_id'), 'user_matches', ['candidate_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_matches_candidate_id'), table_name='user_matches')
+    op.drop_table('user_matches')
@@ -0,0 +1,27 @@
+"""add users version
+
+Revision ID: a6c2e9d4f871
+Revises: d9f3b7a2c1e5
+Create Date: 2025-04-02 18:20:37.640193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e9d4f871'
+down_revision: Union[str, None] = 'd9f3b7a2c1e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Столбец с константным значением по умолчанию добавляется без перезаписи таблицы
+    op.add_column('users', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'version')
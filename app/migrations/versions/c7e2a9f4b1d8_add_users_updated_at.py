@@ -0,0 +1,43 @@
+"""add users updated_at
+
+Revision ID: c7e2a9f4b1d8
+Revises: b8d1e6f3a2c7
+Create Date: 2026-10-18 21:40:12.518304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e2a9f4b1d8'
+down_revision: Union[str, None] = 'b8d1e6f3a2c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # now() - стабильная функция: значение по умолчанию вычисляется один раз, таблица не перезаписывается
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(),
+                                     nullable=False))
+    op.create_index(op.f('ix_users_updated_at'), 'users', ['updated_at'], unique=False)
+
+    # Триггер, а не код приложения: изменения из любого источника (воркеры, users_io, ручные UPDATE)
+    op.execute(
+        "CREATE FUNCTION users_set_updated_at() RETURNS trigger AS $$ "
+        "BEGIN NEW.updated_at := now(); RETURN NEW; END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER users_set_updated_at BEFORE UPDATE ON users "
+        "FOR EACH ROW EXECUTE FUNCTION users_set_updated_at()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER users_set_updated_at ON users")
+    op.execute("DROP FUNCTION users_set_updated_at()")
+    op.drop_index(op.f('ix_users_updated_at'), table_name='users')
+    op.drop_column('users', 'updated_at')
@@ -0,0 +1,57 @@
+"""add users subjects_mask
+
+Revision ID: e3b8f05c7a19
+Revises: a6c2e9d4f871
+Create Date: 2025-04-09 10:14:52.083316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8f05c7a19'
+down_revision: Union[str, None] = 'a6c2e9d4f871'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+# Snapshot of SUBJECT_REGISTRY at the time of this migration: position = bit number.
+SUBJECTS = (
+    "математика", "физика", "химия", "биология",
+    "информатика", "программирование", "история",
+    "география", "литература", "английский язык",
+    "русский язык", "обществознание", "экономика",
+    "философия", "психология", "музыка", "искусство",
+    "право", "медицина", "маркетинг", "менеджмент",
+)
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('subjects_mask', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill in batches outside the migration transaction, each batch commits on its own. Rows are
+    # picked by the missing mask rather than by id ranges, so rows written by the running bot during
+    # the backfill (with the server default 0) are picked up as well. Only rows with at least one
+    # registry subject are selected; their new mask is never 0, so the loop ends.
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            result = bind.execute(sa.text(
+                "UPDATE users SET subjects_mask = ("
+                "SELECT bit_or(1 << (registry.position - 1)::int) "
+                "FROM unnest(CAST(:subjects AS varchar[])) WITH ORDINALITY AS registry(subject, position) "
+                "WHERE registry.subject = ANY(users.subjects)"
+                ") "
+                "WHERE id IN (SELECT id FROM users WHERE subjects_mask = 0 AND cardinality(subjects) > 0 "
+                "AND subjects && CAST(:subjects AS varchar[]) LIMIT :batch_size)"
+            ), {"subjects": list(SUBJECTS), "batch_size": BACKFILL_BATCH_SIZE})
+            if result.rowcount == 0:
+                break
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'subjects_mask')
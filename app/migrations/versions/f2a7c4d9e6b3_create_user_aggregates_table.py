@@ -0,0 +1,44 @@
+"""create user_aggregates table
+
+Revision ID: f2a7c4d9e6b3
+Revises: e3b8f05c7a19
+Create Date: 2025-04-12 16:27:38.519204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a7c4d9e6b3'
+down_revision: Union[str, None] = 'e3b8f05c7a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_aggregates',
+    sa.Column('dimension', sa.String(), nullable=False),
+    sa.Column('value', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('dimension', 'value')
+    )
+
+    # Initial counts; later they change by deltas. Age bands as in app.bot.aggregates.AGE_BANDS.
+    op.execute(
+        "INSERT INTO user_aggregates (dimension, value, count) "
+        "SELECT 'subject', subject, count(DISTINCT id) FROM users, unnest(subjects) AS subject GROUP BY subject "
+        "UNION ALL SELECT 'country', location_key, count(*) FROM users WHERE location_key IS NOT NULL "
+        "GROUP BY location_key "
+        "UNION ALL SELECT 'language', language, count(*) FROM users GROUP BY language "
+        "UNION ALL SELECT 'age_band', CASE "
+        "WHEN age >= 55 THEN '55+' WHEN age >= 45 THEN '45–54' WHEN age >= 35 THEN '35–44' "
+        "WHEN age >= 25 THEN '25–34' WHEN age >= 18 THEN '18–24' ELSE '13–17' END, count(*) "
+        "FROM users GROUP BY 2"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_aggregates')
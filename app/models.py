@@ -1,4 +1,7 @@
-from sqlalchemy import Column, String, Integer, ARRAY, BigInteger
+from sqlalchemy import (
+    Column, String, Integer, ARRAY, BigInteger, Index, ForeignKey, SmallInteger, DateTime, LargeBinary, func,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 
 from app.database import Base
 
@@ -8,7 +11,63 @@ class User(Base):
     telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String, nullable=True)
     location  = Column(String, nullable=False)
+    location_key = Column(String, nullable=True, index=True)
     language = Column(String, nullable=False)
     gender = Column(String, nullable=False)
-    age = Column(Integer, nullable=False)
-    subjects = Column(ARRAY(String), nullable=False)
\ No newline at end of file
+    age = Column(Integer, nullable=False, index=True)
+    subjects = Column(ARRAY(String), nullable=False)
+    # Биты предметов по SUBJECT_REGISTRY из app/utils/validation.py
+    subjects_mask = Column(Integer, nullable=False, server_default="0")
+    # Увеличивается при каждом изменении профиля, ключ кэша карточек
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Ставится триггером при каждом изменении строки, по нему движок сопоставления подгружает изменения
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+    __table_args__ = (
+        Index("ix_users_subjects", "subjects", postgresql_using="gin"),
+    )
+
+
+class UserMatch(Base):
+    __tablename__ = "user_matches"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(SmallInteger, primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(Integer, nullable=False)
+
+
+class MatchSubscription(Base):
+    __tablename__ = "match_subscriptions"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_notified_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+class UserAggregate(Base):
+    __tablename__ = "user_aggregates"
+
+    # subject, country, language, age_band; счетчики меняются дельтами в транзакции изменения профиля
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, server_default="0")
+
+
+class SeenFilter(Base):
+    __tablename__ = "seen_filters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Фильтр Блума по User.id уже показанных партнеров, см. app/bot/seen.py
+    bits = Column(LargeBinary, nullable=False)
+    items = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
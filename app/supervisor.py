@@ -0,0 +1,310 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from bisect import bisect_right
+from multiprocessing.sharedctypes import Synchronized
+
+from aiogram import Bot
+from aiogram.dispatcher.dispatcher import DEFAULT_BACKOFF_CONFIG
+from aiogram.utils.backoff import Backoff
+from aiogram.types import Update
+
+from app.config import settings
+from app.database import ShutdownFlushError
+from app.utils.log import configure_logging
+from app.utils.metrics import Gauge, serve_metrics, set_ready
+
+logger = logging.getLogger(__name__)
+
+# Метрики воркеров отдает супервизор: у процессов-воркеров своего HTTP-сервера нет
+WORKER_PROCESSED = Gauge("bot_worker_processed_updates", "Updates processed by a worker process", ("worker",))
+WORKER_IN_FLIGHT = Gauge("bot_worker_in_flight", "Updates a worker process is handling right now", ("worker",))
+WORKER_QUEUE_DEPTH = Gauge("bot_worker_queue_depth", "Updates waiting in a worker's queue", ("worker",))
+WORKER_RESTARTS = Gauge("bot_worker_restarts", "Times a worker process was restarted", ("worker",))
+WORKER_READY = Gauge("bot_worker_ready", "1 once a worker process has started its services", ("worker",))
+
+VIRTUAL_NODES = 128
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring: changing the number of workers moves only ~1/N of the users"""
+
+    def __init__(self, nodes: range, virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted((_hash(f"{node}:{replica}"), node) for node in nodes for replica in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: int) -> int:
+        index = bisect_right(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[index]
+
+
+def partition_key(update: Update) -> int:
+    """The user an update belongs to; updates without a user are spread by update_id"""
+    user = getattr(update.event, "from_user", None)
+    return user.id if user else update.update_id
+
+
+class WorkerStats:
+    def __init__(self, context: multiprocessing.context.BaseContext):
+        self.processed: Synchronized = context.Value("q", 0)
+        self.in_flight: Synchronized = context.Value("i", 0)
+        self.ready: Synchronized = context.Value("b", 0)
+        self.restarts = 0
+
+
+def worker_main(index: int, updates: multiprocessing.Queue, stats: WorkerStats) -> None:
+    # Процесс запускается через spawn и не наследует настройку логирования родителя
+    configure_logging()
+    # Ctrl+C приходит всей группе процессов; остановкой воркеров управляет супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates, stats))
+
+
+async def _worker_loop(index: int, updates: multiprocessing.Queue, stats: WorkerStats) -> None:
+    # Импорт здесь: у каждого процесса свои Dispatcher, пул соединений и кэши
+    from app.main import build_dispatcher, start_services, stop_services
+
+    bot = Bot(token=settings.BOT_TOKEN)
+    dp = build_dispatcher()
+    await start_services(bot)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    stats.ready.value = 1
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_UPDATES)
+    tasks: set[asyncio.Task] = set()
+
+    async def process(raw: dict) -> None:
+        try:
+            await dp.feed_update(bot, Update.model_validate(raw, context={"bot": bot}))
+        except Exception:
+            logger.exception("Воркер %s: ошибка обработки обновления", index)
+        finally:
+            with stats.in_flight.get_lock():
+                stats.in_flight.value -= 1
+            with stats.processed.get_lock():
+                stats.processed.value += 1
+            semaphore.release()
+
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, updates.get)
+            if raw is None:
+                break
+            await semaphore.acquire()
+            with stats.in_flight.get_lock():
+                stats.in_flight.value += 1
+            task = asyncio.create_task(process(raw))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        stats.ready.value = 0
+        if tasks:
+            await asyncio.wait(tasks, timeout=settings.SHUTDOWN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        try:
+            # ShutdownFlushError завершает процесс воркера с ненулевым кодом
+            await stop_services()
+        finally:
+            await bot.session.close()
+
+
+class Supervisor:
+    """Polls Telegram in one process and dispatches updates to N worker processes.
+
+    Updates are partitioned by from_user.id on a consistent hash ring, so a user's FSM state and
+    caches always live in the same worker. A worker that dies is restarted with a new queue; updates
+    it was processing and those still queued for it are lost and logged.
+    """
+
+    def __init__(self, workers: int = settings.WORKER_PROCESSES):
+        self.workers = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context("spawn")
+        self.ring = HashRing(range(self.workers))
+        self.queues = [self.context.Queue(maxsize=settings.WORKER_QUEUE_SIZE) for _ in range(self.workers)]
+        self.stats = [WorkerStats(self.context) for _ in range(self.workers)]
+        self.processes: list[multiprocessing.Process | None] = [None] * self.workers
+        self._stopping = False
+        for index, stats in enumerate(self.stats):
+            worker = str(index)
+            WORKER_PROCESSED.set_function(lambda stats=stats: stats.processed.value, worker=worker)
+            WORKER_IN_FLIGHT.set_function(lambda stats=stats: stats.in_flight.value, worker=worker)
+            WORKER_QUEUE_DEPTH.set_function(lambda index=index: self._queue_depth(index), worker=worker)
+            WORKER_RESTARTS.set_function(lambda stats=stats: stats.restarts, worker=worker)
+            WORKER_READY.set_function(lambda stats=stats: stats.ready.value, worker=worker)
+
+    def _start_worker(self, index: int) -> None:
+        # Упавший воркер мог не успеть сбросить флаг
+        self.stats[index].ready.value = 0
+        process = self.context.Process(
+            target=worker_main, args=(index, self.queues[index], self.stats[index]),
+            name=f"bot-worker-{index}", daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def _watch_workers(self) -> None:
+        last_report = time.monotonic()
+        last_processed = [0] * self.workers
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    # Процесс мог умереть посреди get с захваченной блокировкой чтения: очередь не переиспользуем
+                    lost = self._replace_queue(index)
+                    logger.warning("Воркер %s завершился с кодом %s, перезапуск; потеряно обновлений из очереди: %s",
+                                   index, process.exitcode, lost)
+                    self.stats[index].restarts += 1
+                    self._start_worker(index)
+            # /ready: все воркеры запустили свои сервисы
+            set_ready(not self._stopping and all(stats.ready.value for stats in self.stats))
+
+            now = time.monotonic()
+            if now - last_report >= settings.WORKER_REPORT_INTERVAL:
+                for index, stats in enumerate(self.stats):
+                    processed = stats.processed.value
+                    rate = (processed - last_processed[index]) / (now - last_report)
+                    last_processed[index] = processed
+                    logger.info("Воркер %s: %.1f обновлений/с, в работе %s, в очереди %s, перезапусков %s",
+                                index, rate, stats.in_flight.value, self._queue_depth(index), stats.restarts)
+                last_report = now
+
+    async def _stop_worker(self, index: int) -> None:
+        """Lets the worker finish its queue, terminates it if that does not happen in SHUTDOWN_TIMEOUT"""
+        process = self.processes[index]
+        if process is None:
+            return
+        loop = asyncio.get_running_loop()
+        updates_queue = self.queues[index]
+        if process.is_alive():
+            try:
+                # Очередь ограничена: put без таймаута зависнет, если воркер не разбирает ее
+                await loop.run_in_executor(
+                    None, functools.partial(updates_queue.put, None, timeout=settings.SHUTDOWN_TIMEOUT)
+                )
+            except queue.Full:
+                logger.warning("Воркер %s не разобрал очередь за %s с, остановка", index, settings.SHUTDOWN_TIMEOUT)
+                process.terminate()
+        await loop.run_in_executor(None, process.join, settings.SHUTDOWN_TIMEOUT)
+        if process.is_alive():
+            logger.warning("Воркер %s не завершился за %s с, остановка", index, settings.SHUTDOWN_TIMEOUT)
+            process.terminate()
+            await loop.run_in_executor(None, process.join)
+        # Недоставленное в очередь мертвого процесса не должно задерживать выход супервизора
+        updates_queue.cancel_join_thread()
+
+    def _replace_queue(self, index: int) -> int | float:
+        """Gives the worker a new empty queue, returns how many updates were left in the old one"""
+        old = self.queues[index]
+        lost = self._queue_depth(index)
+        self.queues[index] = self.context.Queue(maxsize=settings.WORKER_QUEUE_SIZE)
+        # Не ждать при выходе, пока фоновый поток допишет в канал, который никто не читает
+        old.cancel_join_thread()
+        old.close()
+        # Обновления, которые обрабатывал упавший процесс, пропали вместе с ним
+        with self.stats[index].in_flight.get_lock():
+            self.stats[index].in_flight.value = 0
+        return lost
+
+    def _queue_depth(self, index: int) -> int | float:
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:
+            # macOS: sem_getvalue не реализован
+            return float("nan")
+
+    async def _dispatch(self, update: Update) -> None:
+        index = self.ring.node_for(partition_key(update))
+        raw = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        try:
+            self.queues[index].put_nowait(raw)
+            return
+        except queue.Full:
+            pass
+        # Воркер перегружен: ждем место, не блокируя цикл опроса других обновлений. Ждем с таймаутом,
+        # чтобы после перезапуска воркера писать уже в его новую очередь
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, functools.partial(self.queues[index].put, raw, timeout=1))
+                return
+            except queue.Full:
+                continue
+
+    async def run(self) -> None:
+        from app.main import build_dispatcher
+
+        metrics_runner = None
+        if settings.METRICS_PORT:
+            metrics_runner = await serve_metrics(settings.METRICS_HOST, settings.METRICS_PORT)
+        for index in range(self.workers):
+            self._start_worker(index)
+        watcher = asyncio.create_task(self._watch_workers())
+        print(f"Бот запущен! Воркеров: {self.workers}")
+
+        bot = Bot(token=settings.BOT_TOKEN)
+        allowed_updates = build_dispatcher().resolve_used_update_types()
+        offset = None
+        backoff = Backoff(config=DEFAULT_BACKOFF_CONFIG)
+        # SIGTERM (остановка контейнера) и Ctrl+C прерывают опрос, после чего воркеры дорабатывают очереди
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        stopped = asyncio.create_task(stop.wait())
+        try:
+            while not stop.is_set():
+                polling = asyncio.create_task(
+                    bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+                )
+                await asyncio.wait((polling, stopped), return_when=asyncio.FIRST_COMPLETED)
+                if not polling.done():
+                    polling.cancel()
+                    await asyncio.gather(polling, return_exceptions=True)
+                    break
+                try:
+                    updates = polling.result()
+                except Exception as error:
+                    # Как Dispatcher._listen_updates: сетевые ошибки и 5xx Telegram не должны останавливать воркеры
+                    delay = next(backoff)
+                    logger.error("Не удалось получить обновления: %s: %s", type(error).__name__, error)
+                    logger.warning("Повтор через %.1f с (попытка %d)", delay, backoff.counter)
+                    await asyncio.wait((stopped,), timeout=delay)
+                    continue
+                backoff.reset()
+                for update in updates:
+                    await self._dispatch(update)
+                    offset = update.update_id + 1
+        finally:
+            self._stopping = True
+            set_ready(False)
+            stopped.cancel()
+            watcher.cancel()
+            await asyncio.gather(*(self._stop_worker(index) for index in range(self.workers)))
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(sig)
+                except NotImplementedError:
+                    pass
+            await bot.session.close()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+
+        # Воркер с ошибкой при остановке или прерванный terminate не записал свои отложенные изменения
+        failed = [index for index, process in enumerate(self.processes) if process is not None and process.exitcode]
+        if failed:
+            raise ShutdownFlushError(f"Воркеры {failed} завершились с ошибкой, отложенные записи могли быть потеряны")
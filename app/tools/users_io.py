@@ -0,0 +1,95 @@
+"""Bulk import and export of users as CSV or NDJSON.
+
+    python -m app.tools.users_io import users.csv
+    python -m app.tools.users_io export users.ndjson
+
+CSV columns: telegram_id, username, location, language, gender, age, subjects (separated by ';').
+NDJSON lines carry the same keys with subjects as a JSON list. Import upserts on telegram_id and,
+with RECOMMENDATIONS_ENABLED, rebuilds user_matches afterwards: the running bot is not notified of
+profiles changed by another process.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Iterator
+
+from app.bot.crud import UserRepository
+from app.bot.recommendations import RecommendationWorker
+from app.config import settings
+from app.database import async_session_factory
+
+
+def detect_format(path: Path, explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    return "ndjson" if path.suffix in (".ndjson", ".jsonl") else "csv"
+
+
+def read_csv(path: Path) -> Iterator[dict]:
+    with path.open(newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            row["subjects"] = [subject for subject in row["subjects"].split(";") if subject.strip()]
+            yield row
+
+
+def read_ndjson(path: Path) -> Iterator[dict]:
+    with path.open(encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def import_users(path: Path, file_format: str, batch_size: int) -> None:
+    rows = read_ndjson(path) if file_format == "ndjson" else read_csv(path)
+    start = time.perf_counter()
+    async with async_session_factory() as session:
+        count = await UserRepository(session).bulk_upsert(rows, batch_size=batch_size)
+    print(f"Загружено {count} пользователей за {time.perf_counter() - start:.1f} с")
+
+    if settings.RECOMMENDATIONS_ENABLED and count:
+        start = time.perf_counter()
+        await RecommendationWorker(async_session_factory).rebuild_all()
+        print(f"Рекомендации пересчитаны за {time.perf_counter() - start:.1f} с")
+
+
+async def export_users(path: Path, file_format: str) -> None:
+    start = time.perf_counter()
+    async with async_session_factory() as session:
+        repo = UserRepository(session)
+        if file_format == "csv":
+            await repo.copy_users_to_csv(str(path))
+        else:
+            with path.open("w", encoding="utf-8") as file:
+                async for user in repo.iter_users():
+                    file.write(json.dumps({
+                        "telegram_id": user.telegram_id,
+                        "username": user.username,
+                        "location": user.location,
+                        "language": user.language,
+                        "gender": user.gender,
+                        "age": user.age,
+                        "subjects": user.subjects,
+                    }, ensure_ascii=False) + "\n")
+    print(f"Выгрузка в {path} завершена за {time.perf_counter() - start:.1f} с")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=("csv", "ndjson"))
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    file_format = detect_format(args.path, args.format)
+    if args.command == "import":
+        asyncio.run(import_users(args.path, file_format, args.batch_size))
+    else:
+        asyncio.run(export_users(args.path, file_format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import logging
+
+from app.config import settings
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s"
+
+
+def configure_logging() -> None:
+    """Root logging for the bot process; spawned workers call it again, they inherit nothing"""
+    logging.basicConfig(level=settings.LOG_LEVEL, format=LOG_FORMAT)
@@ -0,0 +1,233 @@
+import functools
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], **extra: str) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def series(self) -> list[tuple[str, ...]]:
+        return list(self._values)
+
+    def total(self, key: tuple[str, ...]) -> float:
+        return self._values.get(key, 0)
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Value computed on every scrape, e.g. a queue length"""
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> list[str]:
+        values = dict(self._values)
+        values.update((key, function()) for key, function in self._functions.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def series(self) -> list[tuple[str, ...]]:
+        return list(self._counts)
+
+    def count(self, key: tuple[str, ...]) -> int:
+        return sum(self._counts.get(key, ()))
+
+    def quantile(self, q: float, key: tuple[str, ...]) -> float:
+        """Estimates a quantile by linear interpolation inside the bucket that contains it"""
+        counts = self._counts.get(key)
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le=str(bound))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le='+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = Histogram("bot_handler_latency_seconds", "Handler latency by handler and FSM state",
+                            ("handler", "state"))
+REPOSITORY_LATENCY = Histogram("db_repository_latency_seconds", "UserRepository method latency", ("operation",))
+QUERY_LATENCY = Histogram("db_query_latency_seconds", "SQL statement latency by UserRepository method",
+                          ("operation",))
+QUERY_ROWS = Counter("db_query_rows_total", "Rows returned or affected by UserRepository method", ("operation",))
+ADMISSION_REJECTED = Counter("bot_admission_rejected_total", "Updates not run by the admission middleware",
+                             ("action", "reason"))
+ADMISSION_IN_FLIGHT = Gauge("bot_admission_in_flight", "Handlers admitted and still running")
+READY = Gauge("bot_ready", "1 once startup warm-up is finished and updates are processed")
+READY.set(0)
+
+_current_operation: ContextVar[str] = ContextVar("current_operation", default="other")
+
+
+def track_operation(func):
+    """Times a repository coroutine and labels the SQL it runs with the method name"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_operation.set(func.__name__)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            REPOSITORY_LATENCY.observe(time.perf_counter() - start, operation=func.__name__)
+            _current_operation.reset(token)
+
+    return wrapper
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        operation = _current_operation.get()
+        QUERY_LATENCY.observe(elapsed, operation=operation)
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            QUERY_ROWS.inc(cursor.rowcount, operation=operation)
+
+
+def set_ready(ready: bool) -> None:
+    READY.set(int(ready))
+
+
+def is_ready() -> bool:
+    return READY.value() == 1
+
+
+# aiohttp.web импортируется только при запуске HTTP-сервера
+async def metrics_view(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def ready_view(request: "web.Request") -> "web.Response":
+    """Readiness probe: 503 during warm-up and shutdown"""
+    from aiohttp import web
+    return web.Response(text="ready" if is_ready() else "starting", status=200 if is_ready() else 503)
+
+
+async def serve_metrics(host: str, port: int) -> "web.AppRunner":
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    app.router.add_get("/ready", ready_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -13,14 +13,20 @@ VALID_LANGUAGES = {
     "итальянский", "португальский", "хинди", "арабский"
 }
 
-VALID_SUBJECTS = {
+# Номер бита предмета в users.subjects_mask. Список только дополняется в конец: биты уже записаны в БД.
+# В integer помещается 31 предмет.
+SUBJECT_REGISTRY = (
     "математика", "физика", "химия", "биология",
     "информатика", "программирование", "история",
     "география", "литература", "английский язык",
     "русский язык", "обществознание", "экономика",
     "философия", "психология", "музыка", "искусство",
-    "право", "медицина", "маркетинг", "менеджмент"
-}
+    "право", "медицина", "маркетинг", "менеджмент",
+)
+
+SUBJECT_BITS = {subject: 1 << bit for bit, subject in enumerate(SUBJECT_REGISTRY)}
+
+VALID_SUBJECTS = set(SUBJECT_REGISTRY)
 
 MIN_AGE = 13
 MAX_AGE = 80
@@ -39,3 +45,18 @@ def validate_subjects(subjects: List[str]) -> bool:
     """Validates a list of subjects against the VALID_SUBJECTS set"""
     normalized_subjects = [subj.lower().strip() for subj in subjects]
     return all(subject in VALID_SUBJECTS for subject in normalized_subjects)
+
+def normalize_location(location: str) -> str:
+    """Builds the lookup key stored in users.location_key"""
+    return location.strip().lower()
+
+def normalize_subjects(subjects: List[str]) -> List[str]:
+    """Normalizes subjects the way they are stored in users.subjects"""
+    return [subject.strip().lower() for subject in subjects]
+
+def subjects_to_mask(subjects: List[str]) -> int:
+    """Builds users.subjects_mask; unknown subjects have no bit and are ignored"""
+    mask = 0
+    for subject in normalize_subjects(subjects):
+        mask |= SUBJECT_BITS.get(subject, 0)
+    return mask
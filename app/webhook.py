@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from app.config import settings
+from app.utils.metrics import metrics_view, ready_view, set_ready
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookRunner:
+    """aiohttp server feeding webhook updates into Dispatcher.feed_update.
+
+    The request is acknowledged as soon as the update is scheduled; at most `max_concurrent`
+    updates are processed at once, further requests wait for a free slot. For local testing
+    POST a recorded update to the server, e.g.
+    curl -X POST -H 'Content-Type: application/json' -d @update.json http://localhost:8080/webhook
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot,
+                 max_concurrent: int = settings.MAX_CONCURRENT_UPDATES,
+                 shutdown_timeout: float = settings.SHUTDOWN_TIMEOUT):
+        self.dp = dp
+        self.bot = bot
+        self.shutdown_timeout = shutdown_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._tasks: set[asyncio.Task] = set()
+        self._accepting = True
+        self._stop = asyncio.Event()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(settings.WEBHOOK_PATH, self.handle_update)
+        app.router.add_get("/metrics", metrics_view)
+        app.router.add_get("/ready", ready_view)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if settings.WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != settings.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception("Ошибка обработки обновления %s", update.update_id)
+        finally:
+            self._semaphore.release()
+
+    async def drain(self) -> None:
+        """Stops accepting updates and waits for the ones in flight"""
+        self._accepting = False
+        set_ready(False)
+        if not self._tasks:
+            return
+        logger.info("Ожидание завершения %d обновлений", len(self._tasks))
+        done, pending = await asyncio.wait(self._tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except NotImplementedError:
+                pass
+
+        runner = web.AppRunner(self.build_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+        await site.start()
+
+        if settings.WEBHOOK_BASE_URL:
+            await self.bot.set_webhook(
+                url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET or None,
+                allowed_updates=self.dp.resolve_used_update_types(),
+                max_connections=min(settings.MAX_CONCURRENT_UPDATES, 100),
+            )
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp)
+
+        try:
+            await self._stop.wait()
+        finally:
+            await self.drain()
+            await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp)
+            await runner.cleanup()
+            await self.bot.session.close()
@@ -0,0 +1,155 @@
+"""End-to-end load benchmark: N virtual users drive the real Dispatcher through the bot flows.
+
+Bot API calls are answered by a local stub session, so the numbers cover handlers, FSM,
+middlewares and the repository. Run against the configured Postgres (seed it first with
+benchmarks.seed) or against the in-memory stand-in:
+
+    python -m benchmarks.load --users 200 --rounds 5
+    python -m benchmarks.load --backend memory --population 100000 --users 200
+
+Virtual users send their steps back to back, far faster than a person taps, so the admission
+middleware is off unless --admission is given; with it the report also shows rejected updates.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from aiogram import Bot
+
+from app.bot.aggregates import delete_users
+from app.bot.sender import message_scheduler
+from app.database import async_session_factory
+from app.main import build_dispatcher
+from app.models import User
+from app.utils.metrics import ADMISSION_REJECTED
+from benchmarks.population import generate_users, random_profile
+from benchmarks.stand_in import MemoryUserRepository, StandInMiddleware
+from benchmarks.telegram_stub import StubSession, callback_update, message_update
+
+# Виртуальные пользователи бенчмарка, отдельно от засеянной популяции
+BENCH_TELEGRAM_ID_BASE = 8_000_000_000_000
+
+
+def flows_for(profile: dict) -> dict[str, list[tuple[str, str]]]:
+    age = str(profile["age"])
+    return {
+        "register": [
+            ("message", "/register"),
+            ("message", profile["location"]),
+            ("message", profile["language"]),
+            ("callback", f"gender_{profile['gender']}"),
+            ("message", age),
+            ("message", ", ".join(profile["subjects"])),
+        ],
+        "search_age": [("message", "/search"), ("callback", "search_age"), ("message", age)],
+        "search_location": [("message", "/search"), ("callback", "search_location"), ("message", profile["location"])],
+        "search_subjects": [("message", "/search"), ("callback", "search_subjects"),
+                            ("message", profile["subjects"][0])],
+        "search_best": [("message", "/search"), ("callback", "search_best")],
+        "update": [("message", "/update"), ("callback", "update_age"), ("message", age)],
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.steps: dict[str, list[float]] = defaultdict(list)
+        self.flows: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.updates = 0
+
+
+async def run_flow(dp, bot: Bot, telegram_id: int, name: str, steps: list[tuple[str, str]],
+                   recorder: Recorder) -> None:
+    flow_start = time.perf_counter()
+    for kind, payload in steps:
+        if kind == "message":
+            update = message_update(telegram_id, payload)
+        else:
+            update = callback_update(telegram_id, payload)
+        start = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            recorder.errors[name] += 1
+        recorder.steps[name].append(time.perf_counter() - start)
+        recorder.updates += 1
+    recorder.flows[name].append(time.perf_counter() - flow_start)
+
+
+async def virtual_user(dp, bot: Bot, telegram_id: int, rounds: int, rng: random.Random, recorder: Recorder) -> None:
+    flows = flows_for(random_profile(rng))
+    await run_flow(dp, bot, telegram_id, "register", flows["register"], recorder)
+    names = [name for name in flows if name != "register"]
+    for _ in range(rounds):
+        for name in rng.sample(names, len(names)):
+            await run_flow(dp, bot, telegram_id, name, flows[name], recorder)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(recorder: Recorder, elapsed: float) -> None:
+    print(f"\nОбновлений: {recorder.updates} за {elapsed:.2f} с, {recorder.updates / elapsed:.0f} обновлений/с")
+    print(f"{'сценарий':<16}{'n':>7}{'p50 шаг':>11}{'p95 шаг':>11}{'p99 шаг':>11}{'p50 сценарий':>15}{'ошибки':>8}")
+    for name, steps in recorder.steps.items():
+        flows = recorder.flows[name]
+        print(f"{name:<16}{len(flows):>7}"
+              f"{percentile(steps, 0.5) * 1000:>9.2f}мс{percentile(steps, 0.95) * 1000:>9.2f}мс"
+              f"{percentile(steps, 0.99) * 1000:>9.2f}мс{percentile(flows, 0.5) * 1000:>13.2f}мс"
+              f"{recorder.errors[name]:>8}")
+
+
+async def cleanup_postgres() -> None:
+    async with async_session_factory() as session:
+        await delete_users(session, User.telegram_id.between(BENCH_TELEGRAM_ID_BASE, BENCH_TELEGRAM_ID_BASE + 10**12 - 1))
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.backend == "memory":
+        repo = MemoryUserRepository()
+        for user in generate_users(args.population):
+            await repo.create_user(**user)
+        dp = build_dispatcher(StandInMiddleware(repo), admission=args.admission)
+    else:
+        await cleanup_postgres()
+        dp = build_dispatcher(admission=args.admission)
+
+    bot = Bot(token="42:benchmark", session=StubSession(latency=args.api_latency))
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(dp, bot, BENCH_TELEGRAM_ID_BASE + index, args.rounds, random.Random(rng.random()), recorder)
+        for index in range(args.users)
+    ))
+    report(recorder, time.perf_counter() - start)
+    if args.admission:
+        rejected = ", ".join(f"{action}/{reason}: {int(ADMISSION_REJECTED.total((action, reason)))}"
+                             for action, reason in sorted(ADMISSION_REJECTED.series()))
+        print(f"Отклонено middleware допуска: {rejected or 'нет'}")
+    print(f"В очереди отправки осталось сообщений: {len(message_scheduler)}")
+    await message_scheduler.close(timeout=0)
+
+    if args.backend == "postgres":
+        await cleanup_postgres()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("postgres", "memory"), default="postgres")
+    parser.add_argument("--users", type=int, default=100, help="число одновременных виртуальных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз каждый проходит поиск и /update")
+    parser.add_argument("--population", type=int, default=10_000, help="размер популяции для --backend memory")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="имитация задержки Bot API, секунды")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--admission", action="store_true", help="включить лимиты middleware допуска")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Synthetic user populations with roughly realistic distributions"""
+import random
+from typing import Iterator
+
+from app.utils.validation import VALID_COUNTRIES, VALID_LANGUAGES, VALID_SUBJECTS, MIN_AGE, MAX_AGE
+
+# Синтетические telegram_id начинаются далеко за пределами реальных
+SYNTHETIC_TELEGRAM_ID_BASE = 9_000_000_000_000
+
+COUNTRY_WEIGHTS = {country: 1 for country in VALID_COUNTRIES} | {
+    "Россия": 40, "Украина": 8, "Беларусь": 6, "Казахстан": 8, "США": 4, "Германия": 4,
+}
+COUNTRY_LANGUAGE = {
+    "Россия": "русский", "Украина": "русский", "Беларусь": "русский", "Казахстан": "русский",
+    "США": "английский", "Канада": "английский", "Великобритания": "английский", "Австралия": "английский",
+    "Германия": "немецкий", "Франция": "французский", "Италия": "итальянский", "Испания": "испанский",
+    "Мексика": "испанский", "Бразилия": "португальский", "Китай": "китайский", "Япония": "японский",
+    "Южная Корея": "корейский", "Индия": "хинди",
+}
+SUBJECT_WEIGHTS = {subject: 1 for subject in VALID_SUBJECTS} | {
+    "математика": 10, "программирование": 9, "английский язык": 9, "физика": 5, "информатика": 5,
+}
+
+_countries, _country_weights = zip(*sorted(COUNTRY_WEIGHTS.items()))
+_subjects, _subject_weights = zip(*sorted(SUBJECT_WEIGHTS.items()))
+_languages = sorted(VALID_LANGUAGES)
+
+
+def random_profile(rng: random.Random) -> dict:
+    location = rng.choices(_countries, _country_weights)[0]
+    # Большинство общается на языке своей страны
+    if location in COUNTRY_LANGUAGE and rng.random() < 0.8:
+        language = COUNTRY_LANGUAGE[location]
+    else:
+        language = rng.choice(_languages)
+
+    subjects = set()
+    for _ in range(rng.choices((1, 2, 3, 4), (35, 35, 20, 10))[0]):
+        subjects.add(rng.choices(_subjects, _subject_weights)[0])
+
+    return {
+        "location": location,
+        "language": language,
+        "gender": rng.choice(("male", "female")),
+        "age": min(MAX_AGE, max(MIN_AGE, int(rng.gauss(22, 6)))),
+        "subjects": sorted(subjects),
+    }
+
+
+def generate_users(count: int, seed: int = 0, telegram_id_base: int = SYNTHETIC_TELEGRAM_ID_BASE) -> Iterator[dict]:
+    rng = random.Random(seed)
+    for index in range(count):
+        yield {
+            "telegram_id": telegram_id_base + index,
+            "username": f"synthetic_{index}" if rng.random() < 0.7 else None,
+            **random_profile(rng),
+        }
@@ -0,0 +1,45 @@
+"""Seeds the configured database with a synthetic population.
+
+    python -m benchmarks.seed --users 100000
+    python -m benchmarks.seed --delete
+"""
+import argparse
+import asyncio
+import time
+
+from app.bot.aggregates import delete_users
+from app.bot.crud import UserRepository
+from app.database import async_session_factory
+from app.models import User
+from benchmarks.population import SYNTHETIC_TELEGRAM_ID_BASE, generate_users
+
+
+async def seed(count: int, batch_size: int, seed_value: int) -> None:
+    start = time.perf_counter()
+    async with async_session_factory() as session:
+        inserted = await UserRepository(session).bulk_upsert(generate_users(count, seed_value), batch_size=batch_size)
+    print(f"Создано {inserted} пользователей за {time.perf_counter() - start:.1f} с")
+
+
+async def delete_synthetic() -> None:
+    async with async_session_factory() as session:
+        deleted = await delete_users(session, User.telegram_id >= SYNTHETIC_TELEGRAM_ID_BASE)
+    print(f"Удалено {deleted} синтетических пользователей")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--delete", action="store_true", help="удалить ранее созданных синтетических пользователей")
+    args = parser.parse_args()
+
+    if args.delete:
+        asyncio.run(delete_synthetic())
+    else:
+        asyncio.run(seed(args.users, args.batch_size, args.seed))
+
+
+if __name__ == "__main__":
+    main()
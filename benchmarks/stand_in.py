@@ -0,0 +1,127 @@
+"""In-memory stand-in for UserRepository, for benchmarking the bot without Postgres"""
+import itertools
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.bot.aggregates import aggregates, profile_delta, profile_of
+from app.bot.crud import PAGE_SIZE, MatchPage
+from app.bot.engine import page_ids
+from app.models import User
+from app.utils.validation import normalize_location
+
+
+class MemoryUserRepository:
+    """Implements the UserRepository interface over plain dicts, scanning like Postgres would without indexes"""
+
+    def __init__(self):
+        self.users: dict[int, User] = {}
+        self.seen: dict[int, set[int]] = {}
+        self._ids = itertools.count(1)
+
+    async def create_user(self, telegram_id: int, username: str | None, location: str, language: str,
+                          gender: str, age: int, subjects: list[str]) -> User:
+        user = User(
+            id=next(self._ids),
+            telegram_id=telegram_id,
+            username=username,
+            location=location,
+            location_key=normalize_location(location),
+            language=language,
+            gender=gender,
+            age=age,
+            subjects=[subject.strip().lower() for subject in subjects],
+            version=1,
+        )
+        self.users[telegram_id] = user
+        aggregates.apply(profile_delta(None, profile_of(user)))
+        return user
+
+    async def get_user_by_telegram_id(self, telegram_id: int) -> User | None:
+        return self.users.get(telegram_id)
+
+    async def find_matches_by_age_param(self, telegram_id: int, target_age: int, range: int = 3,
+                                        after_id: int | None = None, before_id: int | None = None,
+                                        limit: int = PAGE_SIZE, exclude_seen: bool = False) -> MatchPage:
+        return self._page(lambda user: abs(user.age - target_age) <= range, telegram_id, after_id, before_id, limit,
+                          exclude_seen)
+
+    async def find_matches_by_location_param(self, telegram_id: int, location: str,
+                                             after_id: int | None = None, before_id: int | None = None,
+                                             limit: int = PAGE_SIZE, exclude_seen: bool = False) -> MatchPage:
+        key = normalize_location(location)
+        return self._page(lambda user: user.location_key == key, telegram_id, after_id, before_id, limit,
+                          exclude_seen)
+
+    async def find_matches_by_subjects_param(self, telegram_id: int, subjects: list[str],
+                                             after_id: int | None = None, before_id: int | None = None,
+                                             limit: int = PAGE_SIZE, min_shared: int = 1,
+                                             exclude_seen: bool = False) -> MatchPage:
+        wanted = {subject.strip().lower() for subject in subjects}
+        return self._page(lambda user: len(wanted.intersection(user.subjects)) >= max(min_shared, 1),
+                          telegram_id, after_id, before_id, limit, exclude_seen)
+
+    async def find_best_matches(self, telegram_id: int, limit: int = PAGE_SIZE,
+                                exclude_seen: bool = False) -> MatchPage:
+        me = self.users.get(telegram_id)
+        if me is None:
+            return MatchPage(users=[])
+        mine = set(me.subjects)
+        seen = self.seen.get(telegram_id, set()) if exclude_seen else set()
+        candidates = [user for user in self.users.values()
+                      if user.telegram_id != telegram_id and not mine.isdisjoint(user.subjects)
+                      and user.id not in seen]
+        candidates.sort(key=lambda user: (
+            -(len(mine.intersection(user.subjects)) * 10
+              + (user.location_key == me.location_key) * 5
+              + (user.language == me.language) * 3
+              - abs(user.age - me.age)),
+            user.id,
+        ))
+        return MatchPage(users=candidates[:limit])
+
+    async def update_user_field(self, telegram_id: int, field: str, value: Any) -> None:
+        user = self.users.get(telegram_id)
+        if user is None:
+            return
+        old = profile_of(user)
+        if field == "subjects":
+            value = [subject.strip().lower() for subject in value]
+        elif field == "location":
+            user.location_key = normalize_location(value)
+        setattr(user, field, value)
+        user.version += 1
+        aggregates.apply(profile_delta(old, profile_of(user)))
+
+    async def mark_seen(self, telegram_id: int, user_ids: list[int]) -> None:
+        self.seen.setdefault(telegram_id, set()).update(user_ids)
+
+    async def reset_seen(self, telegram_id: int) -> None:
+        self.seen.pop(telegram_id, None)
+
+    def _page(self, predicate: Callable[[User], bool], telegram_id: int, after_id: int | None,
+              before_id: int | None, limit: int, exclude_seen: bool = False) -> MatchPage:
+        # Как и в UserRepository, просмотренные пропускаются только при движении вперед
+        seen = self.seen.get(telegram_id, set()) if exclude_seen and before_id is None else set()
+        matches = {user.id: user for user in self.users.values()
+                   if user.telegram_id != telegram_id and user.id not in seen and predicate(user)}
+        ids, next_cursor, prev_cursor = page_ids(sorted(matches), after_id, before_id, limit)
+        return MatchPage(users=[matches[user_id] for user_id in ids], next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
+
+
+class StandInMiddleware(BaseMiddleware):
+    """Replaces DbSessionMiddleware: every update gets the shared in-memory repository"""
+
+    def __init__(self, repo: MemoryUserRepository):
+        self.repo = repo
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        data["repo"] = self.repo
+        return await handler(event, data)
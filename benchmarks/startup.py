@@ -0,0 +1,106 @@
+"""Startup benchmark: how long a fresh process needs and what its first users pay.
+
+Import time is measured in fresh interpreters and needs no database. The database part compares
+the first repository reads of N concurrent users on a fresh pool (as right after a deploy) with
+the same reads after warm_up_pool(); seed the database first with benchmarks.seed.
+
+    python -m benchmarks.startup --skip-db
+    python -m benchmarks.startup --users 10 --budget 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.bot.cache import profile_cache
+from app.bot.crud import UserRepository
+from app.bot.search_cache import search_cache
+from app.bot.warmup import warm_up_pool
+from app.config import settings
+from app.database import _create_engine
+from benchmarks.population import SYNTHETIC_TELEGRAM_ID_BASE
+
+IMPORT_PROBE = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+
+
+def measure_imports(runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+async def first_reads(session_pool: async_sessionmaker, telegram_id: int) -> float:
+    """Latency of what a returning user triggers first: profile lookup and a search"""
+    start = time.perf_counter()
+    async with session_pool() as session:
+        repo = UserRepository(session)
+        user = await repo.get_user_by_telegram_id(telegram_id)
+        if user is not None:
+            await repo.find_matches_by_age_param(telegram_id, user.age)
+            await repo.find_matches_by_subjects_param(telegram_id, user.subjects)
+    return time.perf_counter() - start
+
+
+async def measure_pool(users: int, warm: bool) -> tuple[float, list[float]]:
+    engine = _create_engine(settings.DATABASE_URL_asyncpg)
+    session_pool = async_sessionmaker(engine, expire_on_commit=False)
+    profile_cache.clear()
+    search_cache.clear()
+    try:
+        start = time.perf_counter()
+        if warm:
+            await warm_up_pool(engine, users)
+        warm_up_time = time.perf_counter() - start
+        latencies = await asyncio.gather(*(
+            first_reads(session_pool, SYNTHETIC_TELEGRAM_ID_BASE + index) for index in range(users)
+        ))
+        return warm_up_time, list(latencies)
+    finally:
+        await engine.dispose()
+
+
+def summary(name: str, values: list[float]) -> str:
+    return (f"{name:<22} p50 {statistics.median(values) * 1000:8.1f} мс   "
+            f"max {max(values) * 1000:8.1f} мс")
+
+
+async def run(args: argparse.Namespace) -> int:
+    imports = measure_imports(args.imports)
+    print(summary("import app.main", imports))
+    total = statistics.median(imports)
+
+    if not args.skip_db:
+        _, cold = await measure_pool(args.users, warm=False)
+        warm_up_time, warm = await measure_pool(args.users, warm=True)
+        print(summary("первые запросы (холодно)", cold))
+        print(f"{'прогрев пула':<22} {warm_up_time * 1000:8.1f} мс")
+        print(summary("первые запросы (прогрев)", warm))
+        total += warm_up_time
+
+    print(f"Итого до готовности: {total:.2f} с")
+    if args.budget and total > args.budget:
+        print(f"Превышен бюджет запуска {args.budget:.2f} с")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", type=int, default=5, help="сколько раз измерять импорт в новом процессе")
+    parser.add_argument("--users", type=int, default=settings.DB_WARMUP_CONNECTIONS,
+                        help="одновременные первые пользователи и число прогреваемых соединений")
+    parser.add_argument("--skip-db", action="store_true", help="только время импорта, без базы")
+    parser.add_argument("--budget", type=float, default=0.0, help="ненулевой код выхода, если запуск дольше, секунды")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
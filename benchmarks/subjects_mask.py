@@ -0,0 +1,79 @@
+"""Compares subject search over the TEXT[] column alone with the subjects_condition used by the bot.
+
+Runs the id-list query behind find_matches_by_subjects_param, candidate_ids_query(subjects_condition(...)),
+against an array-only query for a few subject sets, checks that both return the same users and reports
+the median time and the on-disk size of the two columns. Seed the database first with benchmarks.seed.
+
+    python -m benchmarks.subjects_mask --repeat 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import any_, cast, func, select
+
+from app.bot.crud import candidate_ids_query, subjects_condition
+from app.database import async_session_factory
+from app.models import User
+from app.utils.validation import normalize_subjects
+
+QUERIES = (
+    ["программирование"],
+    ["математика", "физика"],
+    ["философия"],
+    ["математика", "программирование", "английский язык"],
+)
+
+
+async def timed(session, query, repeat: int) -> tuple[float, list[int]]:
+    timings = []
+    ids = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ids = list((await session.execute(query)).scalars().all())
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), ids
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with async_session_factory() as session:
+        sizes = (await session.execute(select(
+            func.avg(func.pg_column_size(User.subjects)),
+            func.avg(func.pg_column_size(User.subjects_mask)),
+            func.count(),
+        ))).one()
+        print(f"Пользователей: {sizes[2]}, средний размер subjects {sizes[0] or 0:.1f} байт, "
+              f"subjects_mask {sizes[1] or 0:.1f} байт")
+
+        print(f"{'предметы':<50} {'мин.':>4} {'строк':>8} {'массив':>10} {'&& и маска':>10}")
+        for subjects in QUERIES:
+            for min_shared in (1, 2):
+                if min_shared > len(subjects):
+                    continue
+                if min_shared == 1:
+                    array_condition = User.subjects.op('&&')(normalize_subjects(subjects))
+                else:
+                    # "Не меньше N общих" на массиве требует разворачивать его для каждой строки
+                    subject = func.unnest(User.subjects).table_valued("subject").render_derived()
+                    array_condition = select(func.count()).select_from(subject).where(
+                        subject.c.subject == any_(cast(normalize_subjects(subjects), User.subjects.type))
+                    ).correlate_except(subject).scalar_subquery() >= min_shared
+
+                array_time, array_ids = await timed(session, candidate_ids_query(array_condition), args.repeat)
+                mask_time, mask_ids = await timed(
+                    session, candidate_ids_query(subjects_condition(subjects, min_shared)), args.repeat)
+                if array_ids != mask_ids:
+                    print(f"  расхождение результатов: {len(array_ids)} против {len(mask_ids)}")
+                print(f"{', '.join(subjects):<50} {min_shared:>4} {len(mask_ids):>8} "
+                      f"{array_time * 1000:>8.1f}мс {mask_time * 1000:>8.1f}мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="повторов каждого запроса, берется медиана")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Offline Bot session and synthetic Update factory for driving the real Dispatcher"""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+_message_ids = itertools.count(1)
+_update_ids = itertools.count(1)
+
+# Содержимое любого "скачанного" файла
+STUB_FILE_CONTENT = bytes(range(256)) * 4
+
+
+class StubSession(BaseSession):
+    """Answers every Bot API call locally after an optional simulated network latency"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=next(_message_ids),
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        """Downloads (bot.download_file) return STUB_FILE_CONTENT in chunks of `chunk_size`"""
+        self.calls["stream_content"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for start in range(0, len(STUB_FILE_CONTENT), chunk_size):
+            yield STUB_FILE_CONTENT[start:start + chunk_size]
+
+    async def close(self) -> None:
+        pass
+
+
+def _user(telegram_id: int) -> User:
+    return User(id=telegram_id, is_bot=False, first_name="Bench", username=f"bench_{telegram_id}")
+
+
+def _message(telegram_id: int, text: str) -> Message:
+    return Message(
+        message_id=next(_message_ids),
+        date=datetime.now(),
+        chat=Chat(id=telegram_id, type="private"),
+        from_user=_user(telegram_id),
+        text=text,
+    )
+
+
+def message_update(telegram_id: int, text: str) -> Update:
+    return Update(update_id=next(_update_ids), message=_message(telegram_id, text))
+
+
+def callback_update(telegram_id: int, data: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        callback_query=CallbackQuery(
+            id=str(next(_update_ids)),
+            from_user=_user(telegram_id),
+            chat_instance="bench",
+            message=_message(telegram_id, "bench"),
+            data=data,
+        ),
+    )
@@ -0,0 +1,8 @@
+import os
+
+# Настройки приложения обязательны при импорте; тесты без БД к этим значениям не подключаются
+for name, value in {"BOT_TOKEN": "42:test", "DB_HOST": "localhost", "DB_PORT": "5432",
+                    "DB_USER": "test", "DB_PASS": "test", "DB_NAME": "test",
+                    # numpy в app.bot.engine импортируется только при включенном движке
+                    "MATCHING_ENGINE_ENABLED": "true"}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,91 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.bot.engine import MatchingEngine, page_ids  # noqa: E402
+from app.utils.validation import SUBJECT_REGISTRY, subjects_to_mask  # noqa: E402
+
+FIRST, SECOND, THIRD = SUBJECT_REGISTRY[:3]
+
+
+def engine_with(*rows) -> MatchingEngine:
+    """rows: (id, telegram_id, age, location, language, subjects) in insertion order"""
+    engine = MatchingEngine()
+    engine.ready = True
+    for user_id, telegram_id, age, location, language, subjects in rows:
+        engine._store(user_id, telegram_id, age, location, language, subjects_to_mask(subjects))
+    return engine
+
+
+def test_out_of_order_inserts_are_matched_after_resort():
+    engine = engine_with(
+        (1, 101, 50, "Россия", "русский", [FIRST]),
+        (3, 103, 20, "Германия", "немецкий", [SECOND]),
+        (2, 102, 50, "Россия", "русский", [FIRST]),
+    )
+    assert engine.match_age(0, 20, 0).tolist() == [3]
+
+
+@pytest.mark.parametrize("search", ["age", "location", "subjects", "terms"])
+def test_every_search_sees_resorted_columns(search):
+    engine = engine_with(
+        (5, 105, 30, "Россия", "русский", [FIRST]),
+        (1, 101, 40, "Германия", "немецкий", [SECOND]),
+        (3, 103, 30, "Россия", "русский", [FIRST]),
+    )
+    if search == "age":
+        result = engine.match_age(0, 40, 0)
+    elif search == "location":
+        result = engine.match_location(0, "Германия")
+    elif search == "subjects":
+        result = engine.match_subjects(0, [SECOND])
+    else:
+        result = engine.match_terms(subjects_to_mask([SECOND]), [])
+    assert result.tolist() == [1]
+
+
+def test_unknown_countries_do_not_count_as_same_location():
+    engine = engine_with(
+        (1, 101, 30, "", "русский", [FIRST]),
+        (2, 102, 30, "Россия", "русский", [FIRST]),
+        (3, 103, 30, "", "русский", [FIRST]),
+    )
+    # Как NULL = NULL в SQL: без страны у обоих счет равный, порядок по id
+    assert engine.best_matches(101, 10) == [2, 3]
+
+
+def test_best_matches_rank_by_score_then_id():
+    engine = engine_with(
+        (1, 101, 30, "Россия", "русский", [FIRST, SECOND]),
+        # 10 за предмет - 5 лет разницы = 5
+        (2, 102, 35, "Германия", "немецкий", [FIRST]),
+        # 10 + 5 за страну + 3 за язык = 18
+        (3, 103, 30, "Россия", "русский", [FIRST]),
+        # 20 за два предмета - 1 = 19
+        (4, 104, 31, "Германия", "немецкий", [FIRST, SECOND]),
+        # Тот же счет 18, что у id 3, но id больше
+        (5, 105, 30, "Россия", "русский", [SECOND, THIRD]),
+        # Нет общих предметов
+        (6, 106, 30, "Россия", "русский", [THIRD]),
+    )
+    assert engine.best_matches(101, 10) == [4, 3, 5, 2]
+    assert engine.best_matches(101, 2) == [4, 3]
+    assert engine.best_matches(999, 10) == []
+
+
+IDS = [2, 4, 6, 8, 10]
+
+
+@pytest.mark.parametrize("after_id, before_id, expected", [
+    (None, None, ([2, 4], 4, None)),
+    (4, None, ([6, 8], 8, 6)),
+    (5, None, ([6, 8], 8, 6)),
+    (8, None, ([10], None, 10)),
+    (10, None, ([], None, None)),
+    (None, 6, ([2, 4], 4, None)),
+    (None, 10, ([6, 8], 8, 6)),
+    (None, 2, ([], None, None)),
+])
+def test_page_ids_follows_keyset_cursors(after_id, before_id, expected):
+    page, next_cursor, prev_cursor = page_ids(IDS, after_id, before_id, 2)
+    assert (list(page), next_cursor, prev_cursor) == expected
@@ -0,0 +1,117 @@
+import asyncio
+from array import array
+
+import pytest
+
+from app.bot.search_cache import SearchResultCache, without
+
+
+def make_cache(max_entry_ids: int = 100) -> SearchResultCache:
+    return SearchResultCache(max_ids=1000, max_entry_ids=max_entry_ids, ttl=60)
+
+
+class Loader:
+    """Counts loads; each one waits for `release` so concurrent callers overlap"""
+
+    def __init__(self, ids=(1, 2, 3)):
+        self.ids = array("q", ids)
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, limit: int) -> array:
+        self.calls += 1
+        await self.release.wait()
+        return self.ids[:limit]
+
+
+def test_concurrent_misses_share_one_load():
+    async def scenario():
+        cache, load = make_cache(), Loader()
+        readers = [asyncio.create_task(cache.get(("age", 25), load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        load.release.set()
+        results = await asyncio.gather(*readers)
+        assert load.calls == 1
+        assert all(result is results[0] for result in results)
+        assert (cache.misses, cache.shared) == (1, 4)
+        assert await cache.get(("age", 25), load) is results[0]
+        assert cache.hits == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_reaches_waiters_and_is_retried():
+    async def scenario():
+        cache = make_cache()
+        release = asyncio.Event()
+
+        async def failing(limit: int) -> array:
+            await release.wait()
+            raise RuntimeError("db down")
+
+        readers = [asyncio.create_task(cache.get(("age", 25), failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*readers, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        load = Loader()
+        load.release.set()
+        assert list(await cache.get(("age", 25), load)) == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_bump_invalidates_only_dependent_search_types():
+    async def scenario():
+        cache, load = make_cache(), Loader()
+        load.release.set()
+        await cache.get(("age", 25), load)
+        await cache.get(("location", "россия"), load)
+        cache.bump(["language"])
+        await cache.get(("age", 25), load)
+        assert load.calls == 2
+        cache.bump(["age"])
+        await cache.get(("age", 25), load)
+        await cache.get(("location", "россия"), load)
+        assert load.calls == 3
+        cache.bump()
+        await cache.get(("location", "россия"), load)
+        assert load.calls == 4
+
+    asyncio.run(scenario())
+
+
+def test_result_loaded_across_a_bump_is_not_stored():
+    async def scenario():
+        cache, load = make_cache(), Loader()
+        reader = asyncio.create_task(cache.get(("age", 25), load))
+        await asyncio.sleep(0)
+        cache.bump(["age"])
+        load.release.set()
+        assert list(await reader) == [1, 2, 3]
+        await cache.get(("age", 25), load)
+        assert load.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_oversized_result_is_not_cached_or_reloaded():
+    async def scenario():
+        cache, load = make_cache(max_entry_ids=2), Loader()
+        load.release.set()
+        assert await cache.get(("age", 25), load) is None
+        assert await cache.get(("age", 25), load) is None
+        assert (load.calls, cache.oversized, len(cache)) == (1, 1, 0)
+        cache.bump(["age"])
+        assert await cache.get(("age", 25), load) is None
+        assert load.calls == 2
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("user_id, expected", [(None, [1, 3, 5]), (3, [1, 5]), (4, [1, 3, 5])])
+def test_without_removes_only_the_requester(user_id, expected):
+    ids = array("q", [1, 3, 5])
+    assert list(without(ids, user_id)) == expected
+    assert list(ids) == [1, 3, 5]
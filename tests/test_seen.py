@@ -0,0 +1,52 @@
+"""The seen filter marks ids in Python and tests them in SQL; both must compute the same bit positions"""
+import pytest
+from sqlalchemy import Integer, column
+from sqlalchemy.dialects.postgresql.asyncpg import dialect
+
+from app.bot import seen
+
+
+def get_bit(bits: bytes, position: int) -> int:
+    """Postgres get_bit(bytea, n): bit n % 8, counted from the least significant, of byte n / 8"""
+    return bits[position // 8] >> (position % 8) & 1
+
+
+def sql_unseen(bits: bytes):
+    """seen.unseen() as a Python predicate, evaluated with the parameters Postgres would receive"""
+    compiled = seen.unseen(column("id", Integer), bits).compile(dialect=dialect())
+    params = [compiled.params[name] for name in compiled.positiontup]
+    filter_bits, params = params[0], params[1:]
+    assert filter_bits == bits
+    # На каждую хеш-функцию: A, B, PRIME, размер в битах и 1 в сравнении get_bit(...) = 1
+    groups = [params[start:start + 5] for start in range(0, len(params), 5)]
+    assert len(groups) == len(seen.HASHES)
+    return lambda candidate_id: not all(
+        get_bit(filter_bits, (candidate_id * a + b) % prime % size) == one
+        for a, b, prime, size, one in groups
+    )
+
+
+@pytest.mark.parametrize("size", [16, seen.FILTER_BYTES])
+def test_marked_ids_are_excluded_by_the_sql_condition(size):
+    bits = bytearray(size)
+    marked = [1, 2, 3, 1000, 2**31 - 2, 2**31 + 5, 123_456_789]
+    assert seen.add(bits, marked) == len(marked)
+    unseen = sql_unseen(bytes(bits))
+    for user_id in marked:
+        assert not unseen(user_id), user_id
+
+
+def test_unmarked_ids_pass_unless_every_bit_collides():
+    bits = bytearray(seen.FILTER_BYTES)
+    seen.add(bits, range(1, 200))
+    unseen = sql_unseen(bytes(bits))
+    for user_id in range(200, 2000):
+        expected = not all(get_bit(bits, position) for position in seen.positions(user_id, len(bits) * 8))
+        assert unseen(user_id) == expected, user_id
+    assert unseen(2000)
+
+
+def test_add_counts_only_new_ids():
+    bits = bytearray(seen.FILTER_BYTES)
+    assert seen.add(bits, [5, 6]) == 2
+    assert seen.add(bits, [5, 6, 7]) == 1
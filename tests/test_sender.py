@@ -0,0 +1,24 @@
+from app.bot.sender import CARD_SEPARATOR, split_text
+
+
+def test_short_text_is_one_message():
+    assert split_text("привет", limit=10) == ["привет"]
+
+
+def test_cards_are_kept_whole():
+    cards = ["a" * 4, "b" * 4, "c" * 4]
+    parts = split_text(CARD_SEPARATOR.join(cards), limit=10)
+    assert parts == ["aaaa\n\nbbbb", "cccc"]
+
+
+def test_long_card_is_split_on_lines_and_long_line_on_characters():
+    card = "\n".join(["x" * 3, "y" * 3, "z" * 12])
+    parts = split_text(CARD_SEPARATOR.join(["a" * 2, card]), limit=8)
+    assert parts == ["aa", "xxx\nyyy", "z" * 8, "z" * 4]
+
+
+def test_parts_respect_the_limit_and_keep_the_text():
+    text = CARD_SEPARATOR.join(f"Карточка {index}\n" + "строка\n" * (index % 7) for index in range(200))
+    parts = split_text(text, limit=100)
+    assert all(len(part) <= 100 for part in parts)
+    assert CARD_SEPARATOR.join(parts).replace("\n", "") == text.replace("\n", "")
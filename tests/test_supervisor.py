@@ -0,0 +1,25 @@
+from app.supervisor import HashRing
+
+USERS = range(1, 20001)
+
+
+def test_same_user_always_goes_to_the_same_worker():
+    first, second = HashRing(range(4)), HashRing(range(4))
+    assert all(first.node_for(user) == second.node_for(user) for user in USERS)
+
+
+def test_users_are_spread_over_all_workers():
+    ring = HashRing(range(4))
+    counts = [0] * 4
+    for user in USERS:
+        counts[ring.node_for(user)] += 1
+    # Виртуальные узлы выравнивают нагрузку: каждому воркеру достается около четверти пользователей
+    assert all(abs(count - len(USERS) / 4) < len(USERS) / 4 * 0.25 for count in counts), counts
+
+
+def test_adding_a_worker_moves_only_its_share_of_users():
+    before, after = HashRing(range(4)), HashRing(range(5))
+    moved = [user for user in USERS if before.node_for(user) != after.node_for(user)]
+    # Переезжают только пользователи нового воркера, примерно 1/5
+    assert all(after.node_for(user) == 4 for user in moved)
+    assert len(moved) < len(USERS) * 0.3